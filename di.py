@@ -18,14 +18,34 @@
 """
 
 import csv
+import functools
+import itertools
+import os
+import sqlite3
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import petsc_mod as pe
 import mpg
 import statistics as stats
-from scipy.stats import ks_2samp
+import distributions as dists
+import morris
+import sketch
+import fitting
+from store import EnsembleStore
 from scipy.stats import anderson
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib import colors
+
+# number of .petsc files read ahead while earlier files are reduced
+default_read_ahead_depth = 4
+# number of data sets (and their fits) an analyzer keeps, see Analyzer.get_data()
+default_cache_size = 8
+# number of points above which scatter plots are drawn as a 2d histogram instead of single points
+default_binning_threshold = 10000
+# number of bins per axis of a binned scatter plot
+default_scatter_bins = 200
 
 
 # Reads a csv file and returns its content as a list of lists.
@@ -40,205 +60,92 @@ def values_from_csv(path):
     return results
 
 
-# Reads multiple .petsc files, calculates the sum of the "layer"-th layer for each file and returns this sums as a list.
+# Reads the files "paths" with "reader" in a pool of threads, keeping up to "depth" reads in flight while the caller
+# works on the files read before. On parallel file systems this hides the latency of opening and reading each file. The
+# results are yielded in the order of the paths and a new read is only started when a result is taken, so at most
+# "depth" + 1 files are held in memory.
+#
+# paths:  the paths of the files
+# reader: the function reading a file, e.g. pe.read_PETSc_vec
+# depth:  the number of reads in flight (0 reads the files one after another without threads)
+# return: a generator of the results of "reader"
+def read_ahead(paths, reader, depth):
+    if depth <= 0:
+        for path in paths:
+            yield reader(path)
+        return
+
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        pending = deque(executor.submit(reader, path) for path in itertools.islice(paths, depth))
+        while pending:
+            result = pending.popleft().result()
+            for path in itertools.islice(paths, 1):
+                pending.append(executor.submit(reader, path))
+            yield result
+
+
+# Reads the land sea mask only once, it is the same for all files of an ensemble.
 #
-# file_name: the path to the files containing %i% as an placeholder for the index of the file
-#            (index in range of 0 to n)
-# layer:     the layer to be summed up
-# n:         the number of files to be read
-# return:    a list containing the sums of the "layer"-th layer for each file
-def generate_value_array(file_name, layer, n):
-    values = [0 for i in range(n)]
+# path:   the path to the land sea mask
+# return: the land sea mask
+@functools.lru_cache(maxsize=None)
+def read_land_sea_mask(path):
+    return pe.read_PETSc_matrix(path)
 
-    for i in range(n):
-        values[i] = get_value_from_file(file_name.replace("%i%", str(i)), layer)
 
-    return values
+# Reads the volumes of the grid cells only once, they are the same for all files of an ensemble.
+#
+# path:   the path to the volumes
+# return: the volumes vector
+@functools.lru_cache(maxsize=None)
+def read_volumes(path):
+    return pe.read_PETSc_vec(path)
 
 
-# Calculates the sum of the "layer"-th layer for a given file and returns it.
+# Reads a snapshot of a spin-up, missing snapshots (e.g. of a run that stopped early) are returned as None.
 #
-# file_name: the path to the file
-# layer:     the layer to be summed up
-# return:    the sum of the "layer"-th layer for the given file
-def get_value_from_file(file, layer):
-    lsm = pe.read_PETSc_matrix('landSeaMask.petsc')
-    v = pe.read_PETSc_vec(file)
-    v3d, n1, n2, n3 = pe.reshape_vector_to_3d(lsm, v)
-    if is_rectangle:
-        x1 = rectangle[0]
-        x2 = rectangle[1]
-        y1 = rectangle[2]
-        y2 = rectangle[3]
-
-    layer_sum = 0
-    for x in range(len(v3d[:, :, layer])):
-        for y in range(len(v3d[:, :, layer][x])):
-            if v3d[x][y][layer] == v3d[x][y][layer]:
-                if (not is_rectangle) or (x1 <= x <= x2 and y1 <= y <= y2):
-                    layer_sum += v3d[x][y][layer]
-
-    return layer_sum
-
-
-# Prints out an analysis of the given data. Including Kolmogorov-Smirnov and Anderson-Darling test results and the
-# attributes of the data interpreted as a lognormal and distribution.
-#
-# values: the data to be analyzed.
-# mu:     the mu of the data interpreted as a lognormal distribution
-# s:      the sigma of the data interpreted as a lognormal distribution
-# e:      the expected value of the data interpreted as a lognormal distribution
-# v:      the variance of the data interpreted as a lognormal distribution
-def print_attributes(values, mu, s, e, v):
-    mpg.print_double_seperator()
-    mpg.print_info("Analytics of the values:")
-    mpg.print_seperator()
-
-    data_lognorm = np.random.lognormal(mu, s, 1000000)
-    data_normal = np.random.normal(np.mean(values), np.var(values), 1000000)
-
-    # K-S-Tests
-    result = ks_2samp(values, data_lognorm)
-    result2 = ks_2samp(values, data_normal)
-    mpg.print_info("Kolmogorov-Smirnov test results for a lognormal distribution:")
-    mpg.print_info("statistic: \t" + str(result[0]))
-    mpg.print_info("p-value: \t" + str(result[1]))
-
-    mpg.print_seperator()
-
-    mpg.print_info("Kolmogorov-Smirnov test results for a normal distribution:")
-    mpg.print_info("statistic: \t" + str(result2[0]))
-    mpg.print_info("p-value: \t" + str(result2[1]))
-
-    mpg.print_seperator()
-
-    # A-D-Test
-    a_d_result = anderson(values)
-    mpg.print_info("Anderon-Darling test results:")
-    mpg.print_info("statistic:\t\t" + str(a_d_result[0]))
-    mpg.print_info("critical values:\t\t" + str(a_d_result[1]))
-    mpg.print_info("significance level:\t" + str(a_d_result[2]))
-
-    mpg.print_seperator()
-    mpg.print_info("values for a lognormal distribution:")
-    mpg.print_info("estimated mu:\t\t\t" + str(mu))
-    mpg.print_info("estimated sigma:\t\t\t" + str(s))
-    mpg.print_info("estimated expected value:\t" + str(e))
-    mpg.print_info("estimated variance:\t\t" + str(v))
-    mpg.print_seperator()
-    mpg.print_info("values for a normal distribution:")
-    mpg.print_info("estimated expected value:\t" + str(np.mean(values)))
-    mpg.print_info("estimated variance:\t\t" + str(np.var(values)))
-    mpg.print_seperator()
-
-
-#  Plots the given data ("values") as a histogram.
+# path:   the path to the snapshot
+# return: the vector of the snapshot or None
+def read_snapshot(path):
+    try:
+        return pe.read_PETSc_vec(path)
+    except (FileNotFoundError, OSError):
+        return None
+
+
+# Returns the path of a snapshot of a spin-up.
 #
-# values:       the data to be plotted
-# path:         the path to the file where the plot should be saved
-# bins:         the number of bins to be used for the histogram
-# title:        the title of the plot
-# color:        the color of the bars in the histogram
-# rotation:     the rotation of the x-axis labels
-# plot:         a boolean value indicating if the approximation of the density function should be plotted
-# second_color: the color of the approximated density function
-# x_axis:       the label of the x-axis
-# x_axis2:      the label of the second x-axis
-# y_axis:       the label of the y-axis
-def generate_histogram(values, path, bins, title, color, rotation, plot, second_color, x_axis, y_axis2, y_axis):
-    fig, ax1 = plt.subplots()
-
-    ax1.tick_params(axis='x', rotation=rotation)
-    ax1.set_ylabel(y_axis)
-    ax1.set_xlabel(x_axis)
-
-    x = np.linspace(stats.get_smallest_number(values), stats.get_largest_number(values), 2000)
-    ax1.hist(values, bins=bins, color=color)
-
-    if plot:
-        ax2 = ax1.twinx()
-        ax2.tick_params(axis='y', labelcolor='red')
-        ax2.set_ylabel(y_axis2)
-
-        mu, s, e, v = stats.estimate_lognorm_data_values(values)
-        y = density_func_lognorm(x, s, mu)
-        ax2.plot(x, y, '--', color=second_color)
-    plt.title(title)
-    plt.tight_layout()
-    plt.xticks(rotation=rotation)
-    plt.savefig(path)
-    mpg.print_success("Histogram saved to " + path)
-
-
-# Plots the two given data arrays ("values1" and "values2") as a scatter plot and prints out the regression function as
-# well as the empirical correlation coefficient.
+# file_name: the path to the snapshots containing %i% as a placeholder for the index of the member and %s% for the
+#            number of the snapshot (like the Metos3DSpinupMonitorFileFormatPrefix "sp$04d-")
+# member:    the index of the member
+# number:    the number of the snapshot
+# digits:    the number of digits %s% is padded to
+# return:    the path of the snapshot
+def snapshot_path(file_name, member, number, digits):
+    return file_name.replace("%i%", str(member)).replace("%s%", str(number).zfill(digits))
+
+
+# Names the data in "path" like its file without the extension and the %i% placeholder, e.g. "N" for "work/N%i%.petsc".
 #
-# values1:      the first data array to be plotted
-# values2:      the second data array to be plotted
-# path:         the path to the file where the plot should be saved
-# title:        the title of the plot
-# x_axis:       the label of the x-axis
-# y_axis:       the label of the y-axis
-# regression:   a boolean value indicating if a regression line should be plotted
-# color:        the color of the data points
-# rotation:     the rotation of the x-axis labels
-# second_color: the color of the regression line
-def generate_scatter_plot(values1, values2, path, title, x_axis, y_axis, regression, color, rotation, regression_color):
-    if len(values1) != len(values2):
-        mpg.print_error("The length of the two arrays is not equal! (" + str(len(values1)) + " != " + str(len(values2))
-                        + ")")
-        mpg.print_error("Hint: the parameter n limits the size of the .petsc arrays")
-        exit(0)
-
-    fig = plt.figure()
-    f = fig.add_subplot(111)
-    f.set_xlabel(x_axis)
-    f.set_ylabel(y_axis)
-    f.scatter(values1, values2, color=color)
-    f.set_title(title)
-    b, a = np.polyfit(values1, values2, 1)
-    if regression:
-        f.plot(values1, np.multiply(b, values1) + a, regression_color)
-
-    plt.xticks(rotation=rotation)
-    plt.tight_layout()
-    plt.savefig(path)
-
-    mpg.print_double_seperator()
-    mpg.print_success("Scatter plot saved to " + path)
-
-    mpg.print_seperator()
-    mpg.print_info("linear regression function:")
-    mpg.print_info("y = " + str(b) + "x + " + str(a))
-    mpg.print_seperator()
-    mpg.print_info(
-        "empirical correlation coefficient: " + str(stats.empirical_correlation_coefficient(values1, values2)))
-    mpg.print_double_seperator()
-
-
-# Plots a lognormal density function with the given parameters.
+# path:   the path to the data
+# return: the name of the data
+def data_name(path):
+    return os.path.splitext(os.path.basename(path))[0].replace("%i%", "")
+
+
+# Returns the path of a plot of the kind "kind". If several plots are made at once, the kind is added to the file name
+# of "output", e.g. "diagram_histogram.png", so the plots do not overwrite each other.
 #
-# mu:    the mu parameter of the lognormal distribution
-# sigma: the sigma parameter of the lognormal distribution
-# path:  the path to the file where the plot should be saved
-# title: the title of the plot
-# x_axis: the label of the x-axis
-# y_axis: the label of the y-axis
-# color: the color of the density function
-# rotation: the rotation of the x-axis labels
-def plot_lognorm(m, s, b, e, n, path, title, x_axis, y_axis, color, rotation):
-    x = np.linspace(b, e, n)
-    y = density_func_lognorm(x, s, m)
-
-    plt.plot(x, y, color)
-    plt.title(title)
-    plt.xlabel(x_axis)
-    plt.ylabel(y_axis)
-
-    plt.xticks(rotation=rotation)
-    plt.tight_layout()
-    plt.savefig(path)
-    mpg.print_success("Plot saved to " + path)
+# output: the path of the file output
+# kind:   the kind of the plot, e.g. "histogram"
+# plots:  the number of plots made at once
+# return: the path of the plot
+def output_path(output, kind, plots):
+    if plots <= 1:
+        return output
+    base, extension = os.path.splitext(output)
+    return base + "_" + kind + extension
 
 
 # The density function of a lognormal distribution.
@@ -248,32 +155,725 @@ def plot_lognorm(m, s, b, e, n, path, title, x_axis, y_axis, color, rotation):
 # mu:     the mu of the lognormal distribution
 # return: the value of the density function at x
 def density_func_lognorm(x, s, m):
-    return np.divide(1, np.sqrt(2 * np.pi) * s * x) * np.exp(-1 * np.divide(np.square(np.log(x) - m), 2 * s ** 2))
-
-
-# see print_attributes()
-#
-# values: the data to be analyzed
-def analyze_data(values):
-    mu, s, e, v = stats.estimate_lognorm_data_values(values)
-    print_attributes(values, mu, s, e, v)
-
-
-# Trys to read data in path (.petsc or csv data) and returns them in a list.
-#
-# path:   the path to the data
-# l:      the layer for the .petsc file
-# return: the data in a list
-def get_data(path, l, n):
-    v = []
-    if ".petsc" in path:
-        v = generate_value_array(path, l, n)
-    elif ".csv" in path:
-        v = values_from_csv(path)[0]
-    else:
-        mpg.print_error("This file format is not supported!")
-        exit(0)
-    return v
+    return dists.Lognormal(m, s).pdf(x)
+
+
+# Loads the data of an ensemble and analyzes and plots it. An analyzer only keeps state of its own (the rectangle, the
+# read ahead depth, the land sea mask, the ensemble store, the binning settings, the printer and the data loaded
+# last), so any number of analyses can run in one long-lived process. The last data sets loaded by get_data() are
+# kept, so several plots of the same data read it only once. Every plot is drawn on a figure of its own, which is
+# closed once it is saved.
+class Analyzer:
+
+    # rectangle:         the rectangle [x0, x1, y0, y1] of the data to analyze (None analyzes all data)
+    # read_ahead_depth:  the number of .petsc files read ahead while earlier files are reduced, see read_ahead()
+    # land_sea_mask:     the path to the land sea mask of the .petsc files
+    # volumes:           the path to the volumes of the grid cells of the .petsc files
+    # store:             the EnsembleStore whose columns can be used as data (None uses files only)
+    # condition:         the SQL condition selecting the members loaded from the store (None loads all members)
+    # binning_threshold: the number of points above which scatter plots are binned, see generate_scatter_plot()
+    # scatter_bins:      the number of bins per axis of a binned scatter plot
+    # fit_criterion:     the criterion ranking the fitted distribution families ("aic" or "bic"), see get_fits()
+    # cache_size:        the number of data sets (and their fits) kept, see get_data() (0 keeps none)
+    # printer:           the mpg.Printer of the messages (default: quiet)
+    def __init__(self, rectangle=None, read_ahead_depth=default_read_ahead_depth, land_sea_mask="landSeaMask.petsc",
+                 volumes="volumes.petsc", store=None, condition=None, binning_threshold=default_binning_threshold,
+                 scatter_bins=default_scatter_bins, fit_criterion="aic", cache_size=default_cache_size, printer=None):
+        self.rectangle = rectangle
+        self.read_ahead_depth = read_ahead_depth
+        self.land_sea_mask = land_sea_mask
+        self.volumes = volumes
+        self.store = store
+        self.condition = condition
+        self.binning_threshold = binning_threshold
+        self.scatter_bins = scatter_bins
+        self.fit_criterion = fit_criterion
+        self.cache_size = cache_size
+        self.loaded = OrderedDict()
+        self.fits = OrderedDict()
+        self.printer = printer
+        if printer is None:
+            self.printer = mpg.Printer(quiet=True)
+
+    # Reads multiple .petsc files, calculates the sum of the "layer"-th layer for each file and returns this sums as a
+    # list.
+    #
+    # file_name: the path to the files containing %i% as an placeholder for the index of the file
+    #            (index in range of 0 to n)
+    # layer:     the layer to be summed up
+    # n:         the number of files to be read
+    # return:    a list containing the sums of the "layer"-th layer for each file
+    def generate_value_array(self, file_name, layer, n):
+        return list(self.generate_value_matrix(file_name, [layer], n)[:, 0])
+
+    # Reads multiple .petsc files once and calculates the sums of all "layers" for each file.
+    #
+    # file_name: the path to the files containing %i% as an placeholder for the index of the file
+    #            (index in range of 0 to n)
+    # layers:    the layers to be summed up
+    # n:         the number of files to be read
+    # return:    a matrix with one row per file and one column per layer
+    def generate_value_matrix(self, file_name, layers, n):
+        values = np.zeros((n, len(layers)))
+        paths = [file_name.replace("%i%", str(i)) for i in range(n)]
+
+        for i, v in enumerate(read_ahead(paths, pe.read_PETSc_vec, self.read_ahead_depth)):
+            v3d = self.vector_to_3d(v)
+            values[i] = [np.nansum(v3d[:, :, layer]) for layer in layers]
+
+        return values
+
+    # Calculates the sum of the "layer"-th layer for a given file and returns it.
+    #
+    # file_name: the path to the file
+    # layer:     the layer to be summed up
+    # return:    the sum of the "layer"-th layer for the given file
+    def get_value_from_file(self, file, layer):
+        return self.get_values_from_file(file, [layer])[0]
+
+    # Calculates the sums of all "layers" for a given file, reading the file only once.
+    #
+    # file:   the path to the file
+    # layers: the layers to be summed up
+    # return: a list containing the sum of each layer
+    def get_values_from_file(self, file, layers):
+        v3d = self.read_3d_from_file(file)
+        return [np.nansum(v3d[:, :, layer]) for layer in layers]
+
+    # Reads a .petsc file as a 3d array (NaN for land cells), restricted to the rectangle if one is given.
+    #
+    # file:   the path to the file
+    # return: the 3d array
+    def read_3d_from_file(self, file):
+        return self.vector_to_3d(pe.read_PETSc_vec(file))
+
+    # Reshapes a vector read from a .petsc file to a 3d array (NaN for land cells), restricted to the rectangle if one
+    # is given.
+    #
+    # v:      the vector
+    # return: the 3d array
+    def vector_to_3d(self, v):
+        lsm = read_land_sea_mask(self.land_sea_mask)
+        v3d, n1, n2, n3 = pe.reshape_vector_to_3d(lsm, v)
+        if self.rectangle is not None:
+            v3d = v3d[self.rectangle[0]:self.rectangle[1] + 1, self.rectangle[2]:self.rectangle[3] + 1, :]
+        return v3d
+
+    # Reads multiple .petsc files one after another and pushes the values of all cells of the "layer"-th layer into a
+    # quantile sketch, so the distribution of the cell values of the whole ensemble can be analyzed without keeping them
+    # in memory.
+    #
+    # file_name: the path to the files containing %i% as an placeholder for the index of the file
+    #            (index in range of 0 to n)
+    # layer:     the layer to be read
+    # n:         the number of files to be read
+    # k:         the accuracy parameter of the sketch
+    # return:    the QuantileSketch of the cell values
+    def generate_value_sketch(self, file_name, layer, n, k):
+        value_sketch = sketch.QuantileSketch(k)
+        paths = [file_name.replace("%i%", str(i)) for i in range(n)]
+
+        for v in read_ahead(paths, pe.read_PETSc_vec, self.read_ahead_depth):
+            value_sketch.update(self.vector_to_3d(v)[:, :, layer])
+
+        return value_sketch
+
+    # Prints out an analysis of the given data. Including Kolmogorov-Smirnov and Anderson-Darling test results and the
+    # attributes of the data interpreted as a lognormal and distribution. Given the "fits" of all distribution families
+    # it also prints their ranking with the Kolmogorov-Smirnov test of every fitted family.
+    #
+    # values: the data to be analyzed.
+    # mu:     the mu of the data interpreted as a lognormal distribution
+    # s:      the sigma of the data interpreted as a lognormal distribution
+    # e:      the expected value of the data interpreted as a lognormal distribution
+    # v:      the variance of the data interpreted as a lognormal distribution
+    # fits:   the fits of the distribution families, see get_fits() (None leaves out the ranking)
+    def print_attributes(self, values, mu, s, e, v, fits=None):
+        self.printer.double_seperator()
+        self.printer.info("Analytics of the values:")
+        self.printer.seperator()
+
+        if fits is not None:
+            self.print_fits(values, fits)
+
+        mean, variance = stats.estimate_normal_data_values(values)
+        if isinstance(values, sketch.QuantileSketch):
+            self.printer.info("analyzing a sketch of " + str(values.n) + " values, rank error bound: " +
+                              str(values.rank_error()))
+            self.printer.seperator()
+
+        # K-S-Tests
+        result = stats.ks_test(values, dists.Lognormal(mu, s).cdf)
+        result2 = stats.ks_test(values, dists.Normal(mean, variance).cdf)
+        self.printer.info("Kolmogorov-Smirnov test results for a lognormal distribution:")
+        self.printer.info("statistic: \t" + str(result[0]))
+        self.printer.info("p-value: \t" + str(result[1]))
+
+        self.printer.seperator()
+
+        self.printer.info("Kolmogorov-Smirnov test results for a normal distribution:")
+        self.printer.info("statistic: \t" + str(result2[0]))
+        self.printer.info("p-value: \t" + str(result2[1]))
+
+        self.printer.seperator()
+
+        # A-D-Test
+        if isinstance(values, sketch.QuantileSketch):
+            self.printer.info("Anderon-Darling test is not available for sketched values.")
+        else:
+            a_d_result = anderson(values)
+            self.printer.info("Anderon-Darling test results:")
+            self.printer.info("statistic:\t\t" + str(a_d_result[0]))
+            self.printer.info("critical values:\t\t" + str(a_d_result[1]))
+            self.printer.info("significance level:\t" + str(a_d_result[2]))
+
+        self.printer.seperator()
+        self.printer.info("values for a lognormal distribution:")
+        self.printer.info("estimated mu:\t\t\t" + str(mu))
+        self.printer.info("estimated sigma:\t\t\t" + str(s))
+        self.printer.info("estimated expected value:\t" + str(e))
+        self.printer.info("estimated variance:\t\t" + str(v))
+        self.printer.seperator()
+        self.printer.info("values for a normal distribution:")
+        self.printer.info("estimated expected value:\t" + str(mean))
+        self.printer.info("estimated variance:\t\t" + str(variance))
+        self.printer.seperator()
+
+    # Prints the maximum likelihood fits of the distribution families ranked by AIC or BIC (see fitting.fit_all()) and
+    # the Kolmogorov-Smirnov test of every fitted family. Continuous and discrete families are ranked separately.
+    #
+    # values: the data the families were fitted to
+    # fits:   the fits, see get_fits()
+    def print_fits(self, values, fits):
+        for discrete in [False, True]:
+            ranked = [fit for fit in fits if fit["discrete"] == discrete]
+            if not ranked:
+                continue
+            self.printer.info("Maximum likelihood fits of the " + ("discrete" if discrete else "continuous") +
+                              " families ranked by " + self.fit_criterion.upper() + ":")
+            for rank in range(len(ranked)):
+                fit = ranked[rank]
+                statistic, p_value = stats.ks_test(values, fit["distribution"].cdf)
+                self.printer.info(str(rank + 1) + ". " + fit["family"] + ":\t" + str(fit["distribution"].parameters()))
+                self.printer.info("\tlog-likelihood: " + str(fit["log_likelihood"]) + "\tAIC: " + str(fit["aic"]) +
+                                  "\tBIC: " + str(fit["bic"]))
+                self.printer.info("\tK-S statistic: " + str(statistic) + "\tp-value: " + str(p_value))
+            self.printer.seperator()
+
+    #  Plots the given data ("values") as a histogram. The counts are computed before plotting, so the plot only holds
+    # one bar per bin however large the data is.
+    #
+    # values:       the data to be plotted (array of numbers or a QuantileSketch)
+    # path:         the path to the file where the plot should be saved
+    # bins:         the number of bins to be used for the histogram
+    # title:        the title of the plot
+    # color:        the color of the bars in the histogram
+    # rotation:     the rotation of the x-axis labels
+    # plot:         a boolean value indicating if the approximation of the density function should be plotted
+    # second_color: the color of the approximated density function
+    # x_axis:       the label of the x-axis
+    # x_axis2:      the label of the second x-axis
+    # y_axis:       the label of the y-axis
+    # family:       the distribution family of the approximated density function, "best" uses the best ranked
+    #               continuous fit (see get_fits())
+    def generate_histogram(self, values, path, bins, title, color, rotation, plot, second_color, x_axis, y_axis2,
+                           y_axis, family="lognormal"):
+        fig, ax1 = plt.subplots()
+
+        ax1.tick_params(axis='x', rotation=rotation)
+        ax1.set_ylabel(y_axis)
+        ax1.set_xlabel(x_axis)
+
+        x = np.linspace(stats.get_smallest_number(values), stats.get_largest_number(values), 2000)
+        if isinstance(values, sketch.QuantileSketch):
+            counts, edges = values.histogram(bins)
+        else:
+            counts, edges = np.histogram(values, bins)
+        ax1.hist(edges[:-1], edges, weights=counts, color=color)
+
+        if plot:
+            ax2 = ax1.twinx()
+            ax2.tick_params(axis='y', labelcolor='red')
+            ax2.set_ylabel(y_axis2)
+
+            fit = fitting.select(self.get_fits(values), family, self.fit_criterion)
+            if fit is None:
+                self.printer.warning("The " + family + " family does not fit the data, no density plotted.")
+            else:
+                ax2.plot(x, fit["distribution"].pdf(x), '--', color=second_color, label=fit["family"])
+                ax2.legend()
+        plt.title(title)
+        plt.tight_layout()
+        plt.xticks(rotation=rotation)
+        plt.savefig(path)
+        plt.close(fig)
+        self.printer.success("Histogram saved to " + path)
+
+    # Plots the two given data arrays ("values1" and "values2") as a scatter plot and prints out the regression function
+    # as well as the empirical correlation coefficient. Above "binning_threshold" points the plot shows the number of
+    # points in each of "scatter_bins" x "scatter_bins" bins (a 2d histogram computed before plotting, drawn as one
+    # raster image) instead of every single point, which keeps rendering time and file size independent of the number
+    # of points.
+    #
+    # values1:      the first data array to be plotted
+    # values2:      the second data array to be plotted
+    # path:         the path to the file where the plot should be saved
+    # title:        the title of the plot
+    # x_axis:       the label of the x-axis
+    # y_axis:       the label of the y-axis
+    # regression:   a boolean value indicating if a regression line should be plotted
+    # color:        the color of the data points
+    # rotation:     the rotation of the x-axis labels
+    # second_color: the color of the regression line
+    def generate_scatter_plot(self, values1, values2, path, title, x_axis, y_axis, regression, color, rotation,
+                              regression_color):
+        if len(values1) != len(values2):
+            raise mpg.ToolkitError("The length of the two arrays is not equal! (" + str(len(values1)) + " != " +
+                                   str(len(values2)) + ")\nHint: the parameter n limits the size of the .petsc arrays")
+
+        fig = plt.figure()
+        f = fig.add_subplot(111)
+        f.set_xlabel(x_axis)
+        f.set_ylabel(y_axis)
+        if len(values1) > self.binning_threshold:
+            counts, x_edges, y_edges = np.histogram2d(values1, values2, self.scatter_bins)
+            mesh = f.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0), norm=colors.LogNorm(),
+                                cmap=colors.LinearSegmentedColormap.from_list("points", ["white", color]),
+                                rasterized=True)
+            fig.colorbar(mesh, ax=f, label="points")
+        else:
+            f.scatter(values1, values2, color=color)
+        f.set_title(title)
+        b, a = np.polyfit(values1, values2, 1)
+        if regression:
+            x = np.array([np.min(values1), np.max(values1)])
+            f.plot(x, b * x + a, regression_color)
+
+        plt.xticks(rotation=rotation)
+        plt.tight_layout()
+        plt.savefig(path)
+        plt.close(fig)
+
+        self.printer.double_seperator()
+        self.printer.success("Scatter plot saved to " + path)
+
+        self.printer.seperator()
+        self.printer.info("linear regression function:")
+        self.printer.info("y = " + str(b) + "x + " + str(a))
+        self.printer.seperator()
+        self.printer.info(
+            "empirical correlation coefficient: " + str(stats.empirical_correlation_coefficient(values1, values2)))
+        self.printer.double_seperator()
+
+    # Loads all given data sets once and computes their full correlation matrix and the linear regression of every
+    # pair. The matrix is saved as a heatmap, the coefficients of every pair are written to a csv table.
+    #
+    # paths:      the paths of the data (.petsc or csv data), .petsc data is reduced to every layer in "layers"
+    # layers:     the layers of the .petsc data to be used
+    # n:          the number of data files to be read in case of .petsc files
+    # path:       the path to the file where the heatmap should be saved
+    # table_path: the path to the csv file where the table should be saved
+    # method:     "pearson" or "spearman"
+    # title:      the title of the plot
+    # rotation:   the rotation of the x-axis labels
+    def generate_correlation_matrix(self, paths, layers, n, path, table_path, method, title, rotation):
+        labels, columns = [], []
+        for data_path in paths:
+            name = data_name(data_path)
+            if ".petsc" in data_path:
+                matrix = self.generate_value_matrix(data_path, layers, n)
+                for i in range(len(layers)):
+                    labels.append(name + "[" + str(layers[i]) + "]")
+                    columns.append(matrix[:, i])
+            else:
+                labels.append(name)
+                columns.append(np.asarray(self.get_data(data_path, 0, n), dtype=float))
+
+        lengths = set(len(column) for column in columns)
+        if len(lengths) != 1:
+            raise mpg.ToolkitError("The length of the arrays is not equal! (" +
+                                   ", ".join(str(len(c)) for c in columns) + ")\nHint: the parameter n limits the size "
+                                   "of the .petsc arrays")
+
+        values = np.column_stack(columns)
+        correlation = stats.correlation_matrix(values, method)
+        slopes, intercepts = stats.linear_regression_matrix(values)
+
+        with open(table_path, "w") as file_stream:
+            writer = csv.writer(file_stream)
+            writer.writerow(["x", "y", method, "slope", "intercept"])
+            for i in range(len(labels)):
+                for j in range(len(labels)):
+                    if i != j:
+                        writer.writerow([labels[i], labels[j], correlation[i, j], slopes[i, j], intercepts[i, j]])
+
+        fig, ax = plt.subplots()
+        image = ax.imshow(correlation, cmap="coolwarm", vmin=-1, vmax=1)
+        fig.colorbar(image, ax=ax, label=method)
+        ax.set_xticks(range(len(labels)))
+        ax.set_yticks(range(len(labels)))
+        ax.set_xticklabels(labels, rotation=rotation)
+        ax.set_yticklabels(labels)
+        if len(labels) <= 15:
+            for i in range(len(labels)):
+                for j in range(len(labels)):
+                    ax.text(j, i, "{:.2f}".format(correlation[i, j]), ha="center", va="center", fontsize=8)
+        ax.set_title(title)
+        plt.tight_layout()
+        plt.savefig(path)
+        plt.close(fig)
+
+        self.printer.double_seperator()
+        self.printer.success("Correlation matrix saved to " + path)
+        self.printer.success("Correlation table saved to " + table_path)
+        self.printer.double_seperator()
+
+    # Analyzes a Morris screening design generated by mpg.py (morris.csv) with the given model outputs of its members.
+    # Prints mu, mu* and sigma of the elementary effects of every parameter, ranked by mu*, and plots sigma over mu*.
+    #
+    # design_path: the path to the morris.csv of the design
+    # data_path:   the path to the outputs of the members (.petsc or csv data)
+    # layer:       the layer of the .petsc data
+    # path:        the path to the file where the plot should be saved
+    # title:       the title of the plot
+    # color:       the color of the data points
+    # rotation:    the rotation of the x-axis labels
+    def generate_morris_analysis(self, design_path, data_path, layer, path, title, color, rotation):
+        unit, parameters = morris.read_design(design_path)
+        values = self.get_data(data_path, layer, len(unit))
+        if len(values) != len(unit):
+            raise mpg.ToolkitError("The number of outputs does not match the number of members of the design! (" +
+                                   str(len(values)) + " != " + str(len(unit)) + ")")
+        mu, mu_star, sigma, effects = morris.analyze(unit, values)
+
+        self.printer.double_seperator()
+        self.printer.info("Morris screening of " + str(unit.shape[1]) + " parameters with " + str(len(effects)) +
+                          " trajectories:")
+        self.printer.seperator()
+        self.printer.info("parameter\tmu*\t\t\tmu\t\t\tsigma")
+        for i in np.argsort(-mu_star):
+            self.printer.info("D" + str(i) + "\t\t" + str(mu_star[i]) + "\t" + str(mu[i]) + "\t" + str(sigma[i]))
+        self.printer.double_seperator()
+
+        fig, ax = plt.subplots()
+        ax.scatter(mu_star, sigma, color=color)
+        for i in range(len(mu_star)):
+            ax.annotate("D" + str(i), (mu_star[i], sigma[i]))
+        ax.set_xlabel("mu*")
+        ax.set_ylabel("sigma")
+        ax.set_title(title)
+        plt.xticks(rotation=rotation)
+        plt.tight_layout()
+        plt.savefig(path)
+        plt.close(fig)
+        self.printer.success("Morris plot saved to " + path)
+
+    # Plots a lognormal density function with the given parameters.
+    #
+    # mu:    the mu parameter of the lognormal distribution
+    # sigma: the sigma parameter of the lognormal distribution
+    # path:  the path to the file where the plot should be saved
+    # title: the title of the plot
+    # x_axis: the label of the x-axis
+    # y_axis: the label of the y-axis
+    # color: the color of the density function
+    # rotation: the rotation of the x-axis labels
+    def plot_lognorm(self, m, s, b, e, n, path, title, x_axis, y_axis, color, rotation):
+        x = np.linspace(b, e, n)
+        y = density_func_lognorm(x, s, m)
+
+        fig = plt.figure()
+        plt.plot(x, y, color)
+        plt.title(title)
+        plt.xlabel(x_axis)
+        plt.ylabel(y_axis)
+
+        plt.xticks(rotation=rotation)
+        plt.tight_layout()
+        plt.savefig(path)
+        plt.close(fig)
+        self.printer.success("Plot saved to " + path)
+
+    # see print_attributes()
+    #
+    # values: the data to be analyzed
+    def analyze_data(self, values):
+        fits = self.get_fits(values)
+        lognormal = fitting.select(fits, "lognormal")
+        if lognormal is None:
+            mu, s, e, v = stats.estimate_lognorm_data_values(values)
+        else:
+            distribution = lognormal["distribution"]
+            mu, s, e, v = distribution.mu, distribution.sigma, distribution.mean(), distribution.variance()
+        self.print_attributes(values, mu, s, e, v, fits)
+
+    # Fits all distribution families to the "values" by maximum likelihood and ranks them (see fitting.fit_all()). Every
+    # data set is fitted only once, so the analysis, the histogram and the lognormal plot of the same data (returned by
+    # get_data()) share the fits. Like the data, only the fits of the last "cache_size" data sets are kept.
+    #
+    # values: the data to be fitted
+    # return: the fits ordered from the best to the worst
+    def get_fits(self, values):
+        # the values are kept with their fits, so their id is not reused by other data
+        key = id(values)
+        if key in self.fits:
+            self.fits.move_to_end(key)
+            return self.fits[key][1]
+        fits = fitting.fit_all(values, self.fit_criterion)
+        self.keep(self.fits, key, (values, fits))
+        return fits
+
+    # Keeps the "value" under the "key" of the "cache" (the loaded data or the fits), dropping the least recently used
+    # entries beyond the cache size.
+    #
+    # cache: the OrderedDict of the entries
+    # key:   the key of the value
+    # value: the value to be kept
+    def keep(self, cache, key, value):
+        cache[key] = value
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    # Drops all data and fits kept by the analyzer, so the next calls of get_data() read the data again.
+    def clear(self):
+        self.loaded.clear()
+        self.fits.clear()
+
+    # Returns the latest modification time of the files the data in "path" is read from (see get_data()), so data
+    # rewritten under the same path is not mistaken for the data read before.
+    #
+    # path:   the path to the data or the name of a column of the store
+    # n:      the number of .petsc files
+    # return: the modification time in nanoseconds (None if none of the files exists)
+    def modification_time(self, path, n):
+        if self.store is not None and path in self.store.columns():
+            paths = [self.store.path]
+        elif "%i%" in path:
+            paths = [path.replace("%i%", str(i)) for i in range(n)]
+        else:
+            paths = [path]
+        return max((os.stat(file).st_mtime_ns for file in paths if os.path.exists(file)), default=None)
+
+    # Computes the volume weighted norm ||y_j - y_j-1|| = sqrt(sum(volumes * (y_j - y_j-1)^2)) of the differences of
+    # successive snapshots of the spin-up of every member, like the spin-up monitor of Metos3D. The snapshots are
+    # streamed: only the previous snapshot is kept, while the next ones are read ahead.
+    #
+    # file_name: the path to the snapshots containing %i% and %s%, see snapshot_path()
+    # n:         the number of members
+    # snapshots: the number of snapshots per member
+    # step:      the number of spin-up years between two snapshots (%s% is replaced by 0, step, 2 * step, ...)
+    # digits:    the number of digits %s% is padded to
+    # return:    the norms (one row per member, NaN for missing snapshots) and for every member whether all its
+    #            snapshots are finite
+    def spinup_norms(self, file_name, n, snapshots, step=1, digits=4):
+        if snapshots < 2:
+            raise mpg.ToolkitError("At least 2 snapshots are needed to analyze a spin-up, got " + str(snapshots) + ".")
+        paths = [snapshot_path(file_name, member, snapshot * step, digits) for member in range(n)
+                 for snapshot in range(snapshots)]
+        volumes = self.vector_to_3d(read_volumes(self.volumes))
+        norms = np.full((n, snapshots - 1), np.nan)
+        finite = np.ones(n, dtype=bool)
+
+        previous = None
+        for index, v in enumerate(read_ahead(paths, read_snapshot, self.read_ahead_depth)):
+            member, snapshot = divmod(index, snapshots)
+            current = None
+            if v is not None:
+                finite[member] &= bool(np.all(np.isfinite(v)))
+                current = self.vector_to_3d(v)
+            if snapshot > 0 and previous is not None and current is not None:
+                norms[member, snapshot - 1] = np.sqrt(np.nansum(volumes * (current - previous) ** 2))
+            previous = current
+
+        return norms, finite
+
+    # Flags the members of a spin-up as converged (the norms of the differences of successive snapshots stay below the
+    # "tolerance" from some snapshot on), diverged (a snapshot is not finite or the last norm is more than "divergence"
+    # times the first), incomplete (snapshots are missing) or not converged. Prints a summary including the share of
+    # the spin-up years computed after the members converged, writes a table of all members, plots the norms and
+    # writes the last norm and the year of convergence of every member to the ensemble store if one is given.
+    #
+    # norms:      the norms of the differences, see spinup_norms()
+    # finite:     for every member whether all its snapshots are finite
+    # step:       the number of spin-up years between two snapshots
+    # tolerance:  the tolerance of the norms
+    # divergence: the factor of growth of the norms marking a member as diverged
+    # path:       the path to the file where the plot should be saved
+    # table_path: the path to the csv file where the table should be saved
+    # title:      the title of the plot
+    # rotation:   the rotation of the x-axis labels
+    # return:     the state and the year of convergence (NaN if not converged) of every member
+    def analyze_spinup(self, norms, finite, step, tolerance, divergence, path, table_path, title, rotation):
+        n, differences = norms.shape
+        years = (np.arange(differences) + 1) * step
+        states, converged_at = [], np.full(n, np.nan)
+        for member in range(n):
+            row = norms[member]
+            if not finite[member] or (np.isfinite(row[0]) and row[-1] > divergence * row[0]):
+                states.append("diverged")
+            elif np.any(np.isnan(row)):
+                states.append("incomplete")
+            elif row[-1] < tolerance:
+                states.append("converged")
+                above = np.flatnonzero(row >= tolerance)
+                converged_at[member] = years[above[-1] + 1] if len(above) > 0 else years[0]
+            else:
+                states.append("not converged")
+
+        with open(table_path, "w") as file_stream:
+            writer = csv.writer(file_stream)
+            writer.writerow(["member", "state", "converged_at", "last_norm", "max_norm"])
+            for member in range(n):
+                writer.writerow([member, states[member], converged_at[member], norms[member, -1],
+                                 np.nanmax(norms[member]) if not np.all(np.isnan(norms[member])) else np.nan])
+
+        state_colors = {"converged": "green", "diverged": "red", "incomplete": "orange", "not converged": "grey"}
+        fig, ax = plt.subplots()
+        for member in range(n):
+            ax.semilogy(years, norms[member], color=state_colors[states[member]], alpha=0.5, linewidth=0.8)
+        ax.axhline(tolerance, linestyle="--", color="black")
+        ax.set_xlabel("spin-up year")
+        ax.set_ylabel("||y_j - y_j-1||")
+        ax.set_title(title)
+        plt.xticks(rotation=rotation)
+        plt.tight_layout()
+        plt.savefig(path)
+        plt.close(fig)
+
+        if self.store is not None:
+            self.store.write_column("spinup_last_norm", norms[:, -1])
+            self.store.write_column("spinup_converged_at", converged_at)
+            self.clear()
+
+        converged = ~np.isnan(converged_at)
+        self.printer.double_seperator()
+        self.printer.info("Spin-up of " + str(n) + " members over " + str(differences * step) + " years (tolerance " +
+                          str(tolerance) + "):")
+        self.printer.seperator()
+        for state in state_colors:
+            self.printer.info(state + ":\t" + str(states.count(state)))
+        if np.any(converged):
+            wasted = np.sum(differences * step - converged_at[converged]) / (n * differences * step)
+            self.printer.info("median year of convergence:\t" + str(np.median(converged_at[converged])))
+            self.printer.info("latest year of convergence:\t" + str(np.max(converged_at[converged])))
+            self.printer.info("share of the spin-up years after convergence:\t" + str(wasted))
+        self.printer.seperator()
+        self.printer.success("Spin-up plot saved to " + path)
+        self.printer.success("Spin-up table saved to " + table_path)
+        self.printer.double_seperator()
+        return states, converged_at
+
+    # Checks whether the outputs of the members of a sequential design (see mpg.py --batch) are enough to estimate the
+    # target statistics precisely: the width of the confidence interval of the mean, the variance and every given
+    # quantile is compared to its tolerance. Prints the intervals and, if a tolerance is not met, the estimated number
+    # of members needed (the widths shrink with the square root of the number of members). An infinite interval of an
+    # extreme quantile is not met, the number of members needed is then at least the smallest number giving it finite
+    # bounds (see statistics.quantile_minimum_size()).
+    #
+    # values:     the outputs of the members, e.g. the sums of a layer
+    # tolerances: the dictionary statistic -> tolerance of the width of its interval, the statistics are "mean",
+    #             "variance" and "quantiles" (a dictionary quantile -> tolerance)
+    # confidence: the confidence level of the intervals
+    # relative:   if True the tolerances are relative to the absolute value of the estimate
+    # return:     True if all tolerances are met, the estimated number of members needed
+    def check_convergence(self, values, tolerances, confidence=0.95, relative=False):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if n < 2:
+            raise mpg.ToolkitError("At least 2 outputs are needed to check the convergence, got " + str(n) + ".")
+
+        intervals = []
+        if "mean" in tolerances:
+            intervals.append(("mean", tolerances["mean"], stats.mean_confidence_interval(values, confidence), None))
+        if "variance" in tolerances:
+            intervals.append(("variance", tolerances["variance"],
+                              stats.variance_confidence_interval(values, confidence), None))
+        quantiles = tolerances.get("quantiles") or {}
+        for q in quantiles:
+            intervals.append(("quantile " + str(q), quantiles[q],
+                              stats.quantile_confidence_interval(values, float(q), confidence), float(q)))
+
+        self.printer.double_seperator()
+        self.printer.info("Convergence of " + str(n) + " outputs (" + str(confidence) + " confidence intervals" +
+                          (", relative tolerances" if relative else "") + "):")
+        self.printer.seperator()
+        self.printer.info("statistic\t\testimate\t\twidth\t\ttolerance")
+        needed = n
+        for name, tolerance, (estimate, lower, upper), q in intervals:
+            width = upper - lower
+            if relative:
+                width = width / abs(estimate)
+            if not np.isfinite(width):
+                # the order statistics bounding the quantile "q" are out of the data, the width only becomes finite
+                # with the smallest number of members they fit into
+                needed = max(needed, n + 1, stats.quantile_minimum_size(q, confidence))
+            elif width > tolerance:
+                needed = max(needed, int(np.ceil(n * (width / tolerance) ** 2)))
+            self.printer.info(name + "\t\t" + str(estimate) + "\t" + str(width) + "\t" + str(tolerance) +
+                              ("" if width <= tolerance else "\t(not met)"))
+        self.printer.seperator()
+
+        converged = needed == n
+        if converged:
+            self.printer.success("All tolerances are met with " + str(n) + " members.")
+        else:
+            self.printer.warning("Not all tolerances are met, at least about " + str(needed) + " members are needed.")
+        self.printer.double_seperator()
+        return converged, needed
+
+    # Sums the "layers" of the .petsc files of all members and writes the sums to the ensemble store, one column per
+    # layer named like the data and the layer, e.g. "N[0]". The file with the index i belongs to the member i.
+    #
+    # file_name: the path to the files containing %i% as an placeholder for the index of the file
+    # layers:    the layers to be summed up
+    # n:         the number of files to be read (None reads one file per member of the store)
+    # return:    the names of the written columns
+    def store_reductions(self, file_name, layers, n=None):
+        if self.store is None:
+            raise mpg.ToolkitError("No ensemble store given.")
+        if n is None:
+            n = self.store.size()
+
+        matrix = self.generate_value_matrix(file_name, layers, n)
+        names = [data_name(file_name) + "[" + str(layer) + "]" for layer in layers]
+        for i in range(len(layers)):
+            self.store.write_column(names[i], matrix[:, i])
+        self.clear()
+        self.printer.success("Wrote the sums of " + str(n) + " files to the columns " + ", ".join(names) + " of " +
+                             self.store.path)
+        return names
+
+    # Trys to read data in path (.petsc or csv data or a column of the ensemble store) and returns them in a list.
+    # The values of columns of the store are ordered by the member index, so the values of different columns at the
+    # same position belong to the same member. The last "cache_size" data sets are kept, further calls with the same
+    # arguments return the data read before unless its files were modified since.
+    #
+    # path:   the path to the data or the name of a column of the store
+    # l:      the layer for the .petsc file
+    # cells:  if True, the values of all cells of the layer of all .petsc files are returned as a QuantileSketch instead
+    #         of the sum of the layer of each file
+    # k:      the accuracy parameter of the sketch
+    # return: the data in a list (or a QuantileSketch)
+    def get_data(self, path, l, n, cells=False, k=sketch.default_k):
+        key = (path, l, n, cells, k, str(self.rectangle), self.condition, self.modification_time(path, n))
+        if key in self.loaded:
+            self.loaded.move_to_end(key)
+            return self.loaded[key]
+
+        v = []
+        if self.store is not None and path in self.store.columns():
+            v = list(self.store.load([path], self.condition)[path])
+        elif ".petsc" in path and cells:
+            v = self.generate_value_sketch(path, l, n, k)
+        elif ".petsc" in path:
+            v = self.generate_value_array(path, l, n)
+        elif ".csv" in path:
+            v = values_from_csv(path)[0]
+        else:
+            raise mpg.ToolkitError("This file format is not supported!")
+        self.keep(self.loaded, key, v)
+        return v
 
 
 if __name__ == '__main__':
@@ -307,9 +907,75 @@ if __name__ == '__main__':
     parser.add_argument('--x_axis', '-xa', help='the title of one or two x-axis of the diagrams')
     parser.add_argument('--y_axis', '-ya', nargs='+', help='the title of the y-axis of the diagrams')
     parser.add_argument('-rt', '--rectangle', type=int, nargs=4, help='just analyze the given rectangle of the data')
+    parser.add_argument('-cm', '--correlation_matrix', metavar='path', nargs='+', help='generate the correlation '
+                                                                                      'matrix and the linear '
+                                                                                      'regressions of all given data')
+    parser.add_argument('-cl', '--correlation_layers', type=int, nargs='+', help='the layers of the .petsc data used '
+                                                                                 'for the correlation matrix (default '
+                                                                                 'the layer given by --layer)')
+    parser.add_argument('-cme', '--correlation_method', choices=['pearson', 'spearman'], help='the correlation '
+                                                                                             'coefficient used for the '
+                                                                                             'correlation matrix '
+                                                                                             '(default pearson)')
+    parser.add_argument('-ct', '--correlation_table', metavar='path', help='the path of the csv table of the '
+                                                                          'correlation matrix (default '
+                                                                          'correlation.csv)')
+    parser.add_argument('-mo', '--morris', metavar='path', nargs=2, help='analyze a Morris screening design, '
+                                                                         'given the morris.csv generated by mpg.py '
+                                                                         'and the outputs of its members')
+    parser.add_argument('-cv', '--cell_values', action='store_true', help='analyze the values of all cells of the '
+                                                                          'layer of all .petsc files (streamed into a '
+                                                                          'quantile sketch) instead of the sum of the '
+                                                                          'layer of each file')
+    parser.add_argument('-sk', '--sketch_size', type=int, help='the accuracy parameter k of the quantile sketch, the '
+                                                               'rank error is about 2.3 / k (default 1000)')
+    parser.add_argument('-ra', '--read_ahead', type=int, help='the number of .petsc files read ahead in parallel '
+                                                              'while earlier files are processed, 0 disables '
+                                                              'reading ahead (default 4)')
     parser.add_argument('-hp', '--histogram_plot', action='store_true', help='generats a approximated plot of an '
                                                                              'lognormal distribution over the '
                                                                              'histogram')
+    parser.add_argument('-ff', '--fit_family', choices=list(fitting.fitters) + ['best'], help='the distribution '
+                                                                                             'family plotted over the '
+                                                                                             'histogram, "best" uses '
+                                                                                             'the best ranked '
+                                                                                             'continuous fit '
+                                                                                             '(default lognormal)')
+    parser.add_argument('-fc', '--fit_criterion', choices=['aic', 'bic'], help='the criterion ranking the maximum '
+                                                                               'likelihood fits of the distribution '
+                                                                               'families (default aic)')
+    parser.add_argument('-st', '--store', metavar='path', help='the ensemble store written by mpg.py, its columns '
+                                                               '(e.g. D0 or N[0]) can be used instead of data paths')
+    parser.add_argument('-sa', '--store_append', metavar='path', help='write the sums of the layers of the given '
+                                                                      '.petsc data (--correlation_layers or --layer) '
+                                                                      'of every member to the ensemble store')
+    parser.add_argument('-wh', '--where', help='the SQL condition selecting the members loaded from the ensemble '
+                                               'store, e.g. \'"D0" > 0.02\'')
+    parser.add_argument('-cc', '--convergence', metavar='path', help='check whether the given outputs of a sequential '
+                                                                     'design meet the tolerances of the "sequential" '
+                                                                     'section of the config (exit code 2 if another '
+                                                                     'batch is needed)')
+    parser.add_argument('--config', metavar='path', help='the config.yaml of mpg.py used for --convergence')
+    parser.add_argument('-bt', '--binning_threshold', type=int, help='the number of points above which scatter plots '
+                                                                     'are drawn as a 2d histogram (default 10000)')
+    parser.add_argument('-sb', '--scatter_bins', type=int, help='the number of bins per axis of a binned scatter plot '
+                                                                '(default 200)')
+    parser.add_argument('-su', '--spinup', metavar='path', help='analyze the convergence of the spin-ups using the '
+                                                                'given snapshots, %%i%% is replaced by the member and '
+                                                                '%%s%% by the spin-up year of the snapshot')
+    parser.add_argument('-ns', '--snapshots', type=int, help='the number of snapshots per member used for --spinup')
+    parser.add_argument('-sst', '--snapshot_step', type=int, help='the number of spin-up years between two snapshots '
+                                                                  '(default 1)')
+    parser.add_argument('-sd', '--snapshot_digits', type=int, help='the number of digits %%s%% is padded to (default '
+                                                                   '4)')
+    parser.add_argument('-to', '--tolerance', type=float, help='the tolerance of the norm of the difference of '
+                                                               'successive snapshots (default 1e-4)')
+    parser.add_argument('-df', '--divergence_factor', type=float, help='the factor of growth of the norms marking a '
+                                                                       'spin-up as diverged (default 10)')
+    parser.add_argument('-vo', '--volumes', metavar='path', help='the volumes of the grid cells weighting the norms '
+                                                                 '(default volumes.petsc)')
+    parser.add_argument('-sut', '--spinup_table', metavar='path', help='the path of the csv table of the spin-up '
+                                                                       'analysis (default spinup.csv)')
 
     args = parser.parse_args()
 
@@ -362,44 +1028,160 @@ if __name__ == '__main__':
     if show_l:
         mpg.print_license()
 
-    rectangle = args.rectangle
-    is_rectangle = rectangle is not None
-
-    analyze = args.analyze
-    if analyze is not None:
-        values = get_data(analyze, 0, 100)
-        analyze_data(values)
-
-    histogram_plot = args.histogram_plot
-
-    histogram = args.histogram
-    if histogram is not None:
-        values = get_data(histogram, layer, num)
-        generate_histogram(values, output, bins, title, color, rotation, histogram_plot, second_color, x_axis, y_axis2,
-                           y_axis)
-
-    scatter_plot = args.scatter_plot
-    regression = args.regression
-    if scatter_plot is not None:
-        values1 = get_data(scatter_plot[0], layer, num)
-        values2 = get_data(scatter_plot[1], layer, num)
-        generate_scatter_plot(values1, values2, output, title, x_axis, y_axis, regression, color, rotation,
-                              second_color)
-
-    number_of_values = args.number_of_values
-    if number_of_values is None:
-        number_of_values = 10000
-
-    plot_range = args.plot_range
-
-    plot_lognormal = args.plot_lognormal
-    if plot_lognormal is not None:
-        values = get_data(plot_lognormal, layer, num)
-        min = stats.get_smallest_number(values)
-        max = stats.get_largest_number(values)
-        if plot_range is not None:
-            min = plot_range[0]
-            max = plot_range[1]
-        mu, s, e, v = stats.estimate_lognorm_data_values(values)
-
-        plot_lognorm(mu, s, min, max, number_of_values, output, title, x_axis, y_axis, color, rotation)
+    read_ahead_depth = args.read_ahead
+    if read_ahead_depth is None:
+        read_ahead_depth = default_read_ahead_depth
+
+    ensemble_store = None
+    if args.store is not None:
+        ensemble_store = EnsembleStore(args.store)
+
+    binning_threshold = args.binning_threshold
+    if binning_threshold is None:
+        binning_threshold = default_binning_threshold
+    scatter_bins = args.scatter_bins
+    if scatter_bins is None:
+        scatter_bins = default_scatter_bins
+
+    fit_criterion = args.fit_criterion
+    if fit_criterion is None:
+        fit_criterion = "aic"
+    fit_family = args.fit_family
+    if fit_family is None:
+        fit_family = "lognormal"
+
+    volumes = args.volumes
+    if volumes is None:
+        volumes = "volumes.petsc"
+
+    analyzer = Analyzer(args.rectangle, read_ahead_depth, volumes=volumes, store=ensemble_store, condition=args.where,
+                        binning_threshold=binning_threshold, scatter_bins=scatter_bins, fit_criterion=fit_criterion,
+                        printer=mpg.default_printer)
+
+    # plots of one invocation share the data loaded by the analyzer, each is saved to a file of its own
+    plots = sum(plot is not None for plot in [args.histogram, args.scatter_plot, args.correlation_matrix, args.morris,
+                                              args.plot_lognormal, args.spinup])
+
+    cell_values = args.cell_values
+    sketch_size = args.sketch_size
+    if sketch_size is None:
+        sketch_size = sketch.default_k
+
+    try:
+        store_append = args.store_append
+        if store_append is not None:
+            store_layers = args.correlation_layers
+            if store_layers is None:
+                store_layers = [layer]
+            analyzer.store_reductions(store_append, store_layers, args.number)
+
+        analyze = args.analyze
+        if analyze is not None:
+            values = analyzer.get_data(analyze, 0, 100, cell_values, sketch_size)
+            analyzer.analyze_data(values)
+
+        histogram_plot = args.histogram_plot
+
+        histogram = args.histogram
+        if histogram is not None:
+            values = analyzer.get_data(histogram, layer, num, cell_values, sketch_size)
+            analyzer.generate_histogram(values, output_path(output, "histogram", plots), bins, title, color, rotation,
+                                        histogram_plot, second_color, x_axis, y_axis2, y_axis, fit_family)
+
+        scatter_plot = args.scatter_plot
+        regression = args.regression
+        if scatter_plot is not None:
+            values1 = analyzer.get_data(scatter_plot[0], layer, num)
+            values2 = analyzer.get_data(scatter_plot[1], layer, num)
+            analyzer.generate_scatter_plot(values1, values2, output_path(output, "scatter_plot", plots), title, x_axis,
+                                           y_axis, regression, color, rotation, second_color)
+
+        correlation_matrix = args.correlation_matrix
+        if correlation_matrix is not None:
+            correlation_layers = args.correlation_layers
+            if correlation_layers is None:
+                correlation_layers = [layer]
+            correlation_method = args.correlation_method
+            if correlation_method is None:
+                correlation_method = "pearson"
+            correlation_table = args.correlation_table
+            if correlation_table is None:
+                correlation_table = "correlation.csv"
+            analyzer.generate_correlation_matrix(correlation_matrix, correlation_layers, num,
+                                                 output_path(output, "correlation_matrix", plots),
+                                                 correlation_table, correlation_method, title, rotation)
+
+        morris_design = args.morris
+        if morris_design is not None:
+            analyzer.generate_morris_analysis(morris_design[0], morris_design[1], layer,
+                                              output_path(output, "morris", plots), title, color, rotation)
+
+        number_of_values = args.number_of_values
+        if number_of_values is None:
+            number_of_values = 10000
+
+        plot_range = args.plot_range
+
+        plot_lognormal = args.plot_lognormal
+        if plot_lognormal is not None:
+            values = analyzer.get_data(plot_lognormal, layer, num, cell_values, sketch_size)
+            min = stats.get_smallest_number(values)
+            max = stats.get_largest_number(values)
+            if plot_range is not None:
+                min = plot_range[0]
+                max = plot_range[1]
+            lognormal = fitting.select(analyzer.get_fits(values), "lognormal")
+            if lognormal is None:
+                raise mpg.ToolkitError("The lognormal family does not fit the data (values <= 0).")
+            mu, s = lognormal["distribution"].mu, lognormal["distribution"].sigma
+
+            analyzer.plot_lognorm(mu, s, min, max, number_of_values, output_path(output, "lognormal", plots), title,
+                                  x_axis, y_axis, color, rotation)
+
+        spinup = args.spinup
+        if spinup is not None:
+            if args.snapshots is None:
+                raise mpg.ToolkitError("--spinup needs the number of --snapshots.")
+            snapshot_step = args.snapshot_step
+            if snapshot_step is None:
+                snapshot_step = 1
+            snapshot_digits = args.snapshot_digits
+            if snapshot_digits is None:
+                snapshot_digits = 4
+            tolerance = args.tolerance
+            if tolerance is None:
+                tolerance = 1e-4
+            divergence_factor = args.divergence_factor
+            if divergence_factor is None:
+                divergence_factor = 10
+            spinup_table = args.spinup_table
+            if spinup_table is None:
+                spinup_table = "spinup.csv"
+            members = args.number
+            if members is None and ensemble_store is not None:
+                members = ensemble_store.size()
+            if members is None:
+                members = num
+            norms, finite = analyzer.spinup_norms(spinup, members, args.snapshots, snapshot_step, snapshot_digits)
+            analyzer.analyze_spinup(norms, finite, snapshot_step, tolerance, divergence_factor,
+                                    output_path(output, "spinup", plots), spinup_table, title, rotation)
+
+        convergence = args.convergence
+        if convergence is not None:
+            if args.config is None:
+                raise mpg.ToolkitError("--convergence needs the --config of the sequential design.")
+            sequential = mpg.read_yaml_file(args.config).get("sequential", {})
+            members = args.number
+            if members is None and ensemble_store is not None:
+                members = ensemble_store.size()
+            if members is None:
+                members = num
+            values = analyzer.get_data(convergence, layer, members)
+            converged, needed = analyzer.check_convergence(values, sequential.get("tolerances", {}),
+                                                           sequential.get("confidence", 0.95),
+                                                           sequential.get("relative", False))
+            if not converged:
+                exit(2)
+    except (mpg.ToolkitError, sqlite3.Error) as exception:
+        mpg.print_error(str(exception))
+        exit(1)
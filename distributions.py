@@ -0,0 +1,479 @@
+"""
+    Uncertainty-Analysis-Toolkit-for-Metos3d can be used to generate option files for Metos3d
+    and interpret Metos3d output data.
+    Copyright (C) 2022  Tom L. Hauschild
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+import numpy as np
+import scipy.optimize
+import scipy.stats
+
+# registry of all distribution families: config "type" -> class
+families = {}
+
+
+# Registers the decorated class as the distribution family "name", so it can be used as "type" in the config file.
+#
+# name:    the name of the distribution family
+# returns: the class decorator
+def register(name):
+    def decorator(cls):
+        cls.name = name
+        families[name] = cls
+        return cls
+
+    return decorator
+
+
+# Creates the distribution configured by the "config" of a single distribution (e.g. the "D0" entry of the config).
+#
+# config:  the config of the distribution, containing the "type" and the parameters of the family
+# returns: the distribution
+def from_config(config):
+    distribution_type = config["type"]
+    if distribution_type not in families:
+        raise KeyError("Distribution type not found: " + str(distribution_type))
+    return families[distribution_type].from_config(config)
+
+
+# Returns the probability of a value of the "distribution" to be out of [lower_bound, upper_bound], i.e. to be redrawn
+# by sample_bounded(). The lower bound is accepted, so discrete distributions only count the values below it.
+#
+# distribution: the distribution
+# lower_bound:  the smallest accepted value
+# upper_bound:  the largest accepted value
+# returns:      the probability
+def out_of_bounds_probability(distribution, lower_bound, upper_bound):
+    below = distribution.cdf(np.nextafter(float(lower_bound), -np.inf))
+    return float(np.clip(below + 1 - distribution.cdf(upper_bound), 0, 1))
+
+
+# Draws "n" values of the "distribution" inside of [lower_bound, upper_bound]. Values out of bounds are redrawn
+# together until "tries" draws were made, values still out of bounds are set to "value_on_fail".
+#
+# distribution:  the distribution to draw from
+# n:             the number of values
+# lower_bound:   the smallest accepted value
+# upper_bound:   the largest accepted value
+# tries:         the number of draws per value
+# value_on_fail: the value used if all draws of a value are out of bounds
+# generator:     the numpy random generator to draw with
+# returns:       the values (integers for discrete families, see typed_values()) and a boolean array marking the
+#                failed values
+def sample_bounded(distribution, n, lower_bound, upper_bound, tries, value_on_fail, generator):
+    values = np.asarray(distribution.sample(n, generator), dtype=float)
+    failed = (values < lower_bound) | (values > upper_bound)
+
+    for i in range(1, tries):
+        count = np.count_nonzero(failed)
+        if count == 0:
+            break
+        values[failed] = distribution.sample(count, generator)
+        failed = (values < lower_bound) | (values > upper_bound)
+
+    values[failed] = value_on_fail
+    return typed_values(distribution, values), failed
+
+
+# Returns the "values" of the "distribution" as integers if the family is discrete, so they are written as "3" rather
+# than "3.0". Values that are not integers (e.g. a value on fail of 2.5) keep all values floats.
+#
+# distribution: the distribution the values belong to
+# values:       the values
+# returns:      the values as a numpy array
+def typed_values(distribution, values):
+    values = np.asarray(values, dtype=float)
+    if distribution.discrete and np.all(values == np.round(values)):
+        return values.astype(int)
+    return values
+
+
+# The base class of all distribution families. A family wraps a frozen scipy distribution for the density,
+# distribution and quantile functions and maps its parameters from and to the keys used in the config file.
+class Distribution:
+    name = None
+    # the config keys of the parameters of the family, in the order of the constructor arguments
+    keys = ()
+    # whether the values of the family are integers
+    discrete = False
+
+    def __init__(self, frozen):
+        self.frozen = frozen
+
+    # Creates the distribution from the config of a single distribution.
+    @classmethod
+    def from_config(cls, config):
+        return cls(*[config[key] for key in cls.keys])
+
+    # Estimates the parameters of the family from the "data" like the fit() of the family, keeping the parameters that
+    # are configured rather than estimated (e.g. the support of a beta distribution).
+    def refit(self, data):
+        return type(self).fit(data)
+
+    # returns: the parameters of the distribution as a dictionary config key -> value
+    def parameters(self):
+        return {key: getattr(self, key) for key in self.keys}
+
+    # Draws "n" values using the numpy random "generator".
+    def sample(self, n, generator):
+        return self.frozen.rvs(size=n, random_state=generator)
+
+    def pdf(self, x):
+        return self.frozen.pdf(x)
+
+    def cdf(self, x):
+        return self.frozen.cdf(x)
+
+    def ppf(self, q):
+        return self.frozen.ppf(q)
+
+    def mean(self):
+        return self.frozen.mean()
+
+    def variance(self):
+        return self.frozen.var()
+
+
+@register("lognormal")
+class Lognormal(Distribution):
+    keys = ("mu", "sigma")
+
+    def __init__(self, mu, sigma):
+        self.mu = mu
+        self.sigma = sigma
+        super().__init__(scipy.stats.lognorm(sigma, scale=np.exp(mu)))
+
+    @classmethod
+    def fit(cls, data):
+        log_data = np.log(data)
+        mu = np.mean(log_data)
+        return cls(mu, np.sqrt(np.mean((log_data - mu) ** 2)))
+
+    def sample(self, n, generator):
+        return generator.lognormal(self.mu, self.sigma, n)
+
+    def pdf(self, x):
+        return np.divide(1, np.sqrt(2 * np.pi) * self.sigma * x) * \
+            np.exp(-1 * np.divide(np.square(np.log(x) - self.mu), 2 * self.sigma ** 2))
+
+    def mean(self):
+        return np.exp(self.mu + 0.5 * self.sigma ** 2)
+
+    def variance(self):
+        s2 = self.sigma ** 2
+        return np.exp(2 * self.mu + s2) * (np.exp(s2) - 1)
+
+
+@register("normal")
+class Normal(Distribution):
+    keys = ("mean", "variance")
+
+    def __init__(self, mean, variance):
+        self._mean = mean
+        self._variance = variance
+        super().__init__(scipy.stats.norm(mean, np.sqrt(variance)))
+
+    @classmethod
+    def fit(cls, data):
+        return cls(np.mean(data), np.var(data))
+
+    def parameters(self):
+        return {"mean": self._mean, "variance": self._variance}
+
+    def sample(self, n, generator):
+        return generator.normal(self._mean, np.sqrt(self._variance), n)
+
+
+@register("geometric")
+class Geometric(Distribution):
+    keys = ("probability",)
+    discrete = True
+
+    def __init__(self, probability):
+        self.probability = probability
+        super().__init__(scipy.stats.geom(probability))
+
+    @classmethod
+    def fit(cls, data):
+        return cls(1 / np.mean(data))
+
+    def sample(self, n, generator):
+        return generator.geometric(self.probability, n)
+
+    def pdf(self, x):
+        return self.frozen.pmf(x)
+
+
+@register("poisson")
+class Poisson(Distribution):
+    keys = ("lambda",)
+    discrete = True
+
+    def __init__(self, lam):
+        self.lam = lam
+        super().__init__(scipy.stats.poisson(lam))
+
+    @classmethod
+    def fit(cls, data):
+        return cls(np.mean(data))
+
+    def parameters(self):
+        return {"lambda": self.lam}
+
+    def sample(self, n, generator):
+        return generator.poisson(self.lam, n)
+
+    def pdf(self, x):
+        return self.frozen.pmf(x)
+
+
+@register("exponential")
+class Exponential(Distribution):
+    keys = ("lambda",)
+
+    def __init__(self, lam):
+        self.lam = lam
+        super().__init__(scipy.stats.expon(scale=1 / lam))
+
+    @classmethod
+    def fit(cls, data):
+        return cls(1 / np.mean(data))
+
+    def parameters(self):
+        return {"lambda": self.lam}
+
+    def sample(self, n, generator):
+        return generator.exponential(1 / self.lam, n)
+
+
+@register("uniform")
+class Uniform(Distribution):
+    keys = ("lower", "upper")
+
+    def __init__(self, lower, upper):
+        self.lower = lower
+        self.upper = upper
+        super().__init__(scipy.stats.uniform(lower, upper - lower))
+
+    @classmethod
+    def fit(cls, data):
+        mean = np.mean(data)
+        half_width = np.sqrt(3 * np.var(data))
+        return cls(mean - half_width, mean + half_width)
+
+    def sample(self, n, generator):
+        return generator.uniform(self.lower, self.upper, n)
+
+
+# beta distribution on [lower, upper] (default [0, 1])
+@register("beta")
+class Beta(Distribution):
+    keys = ("alpha", "beta", "lower", "upper")
+
+    def __init__(self, alpha, beta, lower=0.0, upper=1.0):
+        self.alpha = alpha
+        self.beta = beta
+        self.lower = lower
+        self.upper = upper
+        super().__init__(scipy.stats.beta(alpha, beta, loc=lower, scale=upper - lower))
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["alpha"], config["beta"], config.get("lower", 0.0), config.get("upper", 1.0))
+
+    @classmethod
+    def fit(cls, data, lower=0.0, upper=1.0):
+        scaled = (np.asarray(data) - lower) / (upper - lower)
+        mean = np.mean(scaled)
+        common = mean * (1 - mean) / np.var(scaled) - 1
+        return cls(mean * common, (1 - mean) * common, lower, upper)
+
+    def refit(self, data):
+        return Beta.fit(data, self.lower, self.upper)
+
+
+@register("gamma")
+class Gamma(Distribution):
+    keys = ("shape", "scale")
+
+    def __init__(self, shape, scale):
+        self.shape = shape
+        self.scale = scale
+        super().__init__(scipy.stats.gamma(shape, scale=scale))
+
+    @classmethod
+    def fit(cls, data):
+        mean = np.mean(data)
+        variance = np.var(data)
+        return cls(mean ** 2 / variance, variance / mean)
+
+    def sample(self, n, generator):
+        return generator.gamma(self.shape, self.scale, n)
+
+
+@register("triangular")
+class Triangular(Distribution):
+    keys = ("lower", "mode", "upper")
+
+    def __init__(self, lower, mode, upper):
+        self.lower = lower
+        self.mode = mode
+        self.upper = upper
+        super().__init__(scipy.stats.triang((mode - lower) / (upper - lower), loc=lower, scale=upper - lower))
+
+    @classmethod
+    def fit(cls, data):
+        lower = np.min(data)
+        upper = np.max(data)
+        return cls(lower, np.clip(3 * np.mean(data) - lower - upper, lower, upper), upper)
+
+    def sample(self, n, generator):
+        return generator.triangular(self.lower, self.mode, self.upper, n)
+
+
+# normal distribution with "mean" and "variance" truncated to [lower, upper]
+@register("truncated_normal")
+class TruncatedNormal(Distribution):
+    keys = ("mean", "variance", "lower", "upper")
+
+    def __init__(self, mean, variance, lower, upper):
+        self._mean = mean
+        self._variance = variance
+        self.lower = lower
+        self.upper = upper
+        sd = np.sqrt(variance)
+        super().__init__(scipy.stats.truncnorm((lower - mean) / sd, (upper - mean) / sd, loc=mean, scale=sd))
+
+    # The mean and variance of the parent normal distribution are the maximum likelihood estimates for the given bounds
+    # (default: the smallest and largest value), the mean and variance of the data belong to the truncated distribution.
+    @classmethod
+    def fit(cls, data, lower=None, upper=None):
+        data = np.asarray(data, dtype=float)
+        if lower is None:
+            lower = np.min(data)
+        if upper is None:
+            upper = np.max(data)
+        n = len(data)
+        total = np.sum(data)
+        total_squares = np.dot(data, data)
+
+        def negative_log_likelihood(x):
+            mean, sd = x[0], np.exp(x[1])
+            mass = scipy.stats.norm.cdf((upper - mean) / sd) - scipy.stats.norm.cdf((lower - mean) / sd)
+            return n * np.log(sd) + (total_squares - 2 * mean * total + n * mean ** 2) / (2 * sd ** 2) + \
+                n * np.log(max(mass, 1e-300))
+
+        result = scipy.optimize.minimize(negative_log_likelihood, [np.mean(data), np.log(np.std(data))],
+                                         method="Nelder-Mead", options={"xatol": 1e-10, "fatol": 1e-10,
+                                                                        "maxiter": 10000})
+        return cls(result.x[0], np.exp(2 * result.x[1]), lower, upper)
+
+    def refit(self, data):
+        return TruncatedNormal.fit(data, self.lower, self.upper)
+
+    def parameters(self):
+        return {"mean": self._mean, "variance": self._variance, "lower": self.lower, "upper": self.upper}
+
+
+# resamples given "values" (or the first row of the csv "file"), e.g. parameter values of an earlier calibration
+@register("empirical")
+class Empirical(Distribution):
+    keys = ("values",)
+
+    def __init__(self, values):
+        self.values = np.sort(np.asarray(values, dtype=float))
+        self.density, self.edges = np.histogram(self.values, bins="auto", density=True)
+        super().__init__(None)
+
+    @classmethod
+    def from_config(cls, config):
+        if "file" in config:
+            with open(config["file"]) as file_stream:
+                return cls(next(csv.reader(file_stream, quoting=csv.QUOTE_NONNUMERIC)))
+        return cls(config["values"])
+
+    @classmethod
+    def fit(cls, data):
+        return cls(data)
+
+    def parameters(self):
+        return {"size": len(self.values)}
+
+    def sample(self, n, generator):
+        return generator.choice(self.values, n)
+
+    def pdf(self, x):
+        index = np.searchsorted(self.edges, x, side="right") - 1
+        inside = (index >= 0) & (index < len(self.density))
+        return np.where(inside, self.density[np.clip(index, 0, len(self.density) - 1)], 0.0)
+
+    def cdf(self, x):
+        return np.searchsorted(self.values, x, side="right") / len(self.values)
+
+    def ppf(self, q):
+        return np.quantile(self.values, q, method="inverted_cdf")
+
+    def mean(self):
+        return np.mean(self.values)
+
+    def variance(self):
+        return np.var(self.values)
+
+
+# Draws "n" vectors whose components follow the "marginals" and are coupled by a gaussian copula: correlated standard
+# normal vectors are drawn using the "cholesky" factor of their correlation matrix and every component is transformed
+# to its marginal by its quantile function.
+#
+# marginals: the distribution of every component
+# cholesky:  the lower triangular cholesky factor of the correlation matrix of the copula
+# n:         the number of vectors
+# generator: the numpy random generator to draw with
+# returns:   a matrix with one vector per row
+def sample_gaussian_copula(marginals, cholesky, n, generator):
+    uniform = scipy.stats.norm.cdf(generator.standard_normal((n, len(marginals))) @ cholesky.T)
+    return np.column_stack([marginals[i].ppf(uniform[:, i]) for i in range(len(marginals))])
+
+
+# Draws "n" vectors of the gaussian copula (see sample_gaussian_copula()) inside of the bounds. Vectors with a component
+# out of bounds are redrawn as a whole to keep the correlation, until "tries" draws were made. Components still out of
+# bounds are set to their "values_on_fail".
+#
+# marginals:      the distribution of every component
+# cholesky:       the lower triangular cholesky factor of the correlation matrix of the copula
+# n:              the number of vectors
+# lower_bounds:   the smallest accepted value of every component
+# upper_bounds:   the largest accepted value of every component
+# tries:          the number of draws per vector
+# values_on_fail: the value of every component used if all draws are out of bounds
+# generator:      the numpy random generator to draw with
+# returns:        the vectors (one per row) and a boolean matrix marking the failed values
+def sample_bounded_copula(marginals, cholesky, n, lower_bounds, upper_bounds, tries, values_on_fail, generator):
+    lower_bounds = np.asarray(lower_bounds, dtype=float)
+    upper_bounds = np.asarray(upper_bounds, dtype=float)
+    values = sample_gaussian_copula(marginals, cholesky, n, generator)
+    failed = (values < lower_bounds) | (values > upper_bounds)
+
+    for i in range(1, tries):
+        rows = np.any(failed, axis=1)
+        count = np.count_nonzero(rows)
+        if count == 0:
+            break
+        values[rows] = sample_gaussian_copula(marginals, cholesky, count, generator)
+        failed = (values < lower_bounds) | (values > upper_bounds)
+
+    values = np.where(failed, np.asarray(values_on_fail, dtype=float), values)
+    return values, failed
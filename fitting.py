@@ -0,0 +1,232 @@
+"""
+    Uncertainty-Analysis-Toolkit-for-Metos3d can be used to generate option files for Metos3d
+    and interpret Metos3d output data.
+    Copyright (C) 2022  Tom L. Hauschild
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+from scipy.special import betaln, digamma, gammaln, polygamma
+import distributions as dists
+from sketch import QuantileSketch
+
+# registry of the maximum likelihood fits: family name -> function of the reductions of the data, see fitter()
+fitters = {}
+# the families with a probability mass function, their likelihoods are probabilities rather than densities
+discrete_families = ["poisson", "geometric"]
+# the number of Newton iterations of the gamma and beta fits
+newton_iterations = 50
+
+
+# Registers the decorated function as the maximum likelihood fit of the distribution family "name". The function gets
+# the reductions of the data (see reductions()) and returns the fitted distribution and its log-likelihood, or None if
+# the family does not fit the support of the data.
+#
+# name:    the name of the distribution family, see distributions.families
+# returns: the function decorator
+def fitter(name):
+    def decorator(function):
+        fitters[name] = function
+        return function
+
+    return decorator
+
+
+# Reduces the "data" to the sums all maximum likelihood fits are computed of, so the data is only passed once: the
+# number of values, the sums of the values, their squares, their logarithms and the squares of their logarithms, the
+# smallest and the largest value. Positive data (below one) adds the sum of log(1 - x) for the beta fit, non-negative
+# integer data adds the sum of log(x!) for the discrete fits. NaNs are ignored. A QuantileSketch already keeps the exact
+# sums it needs, so it is not passed at all (the beta and discrete fits are not available for it).
+#
+# data:    the data (array of numbers or a QuantileSketch)
+# returns: a dictionary of the reductions
+def reductions(data):
+    if isinstance(data, QuantileSketch):
+        reduced = {"n": data.n, "sum": data.sum, "sum_squares": data.sum_squares, "min": data.min, "max": data.max}
+        if data.min > 0:
+            reduced["sum_logs"] = data.sum_logs
+            reduced["sum_log_squares"] = data.sum_log_squares
+        return reduced
+
+    values = np.asarray(data, dtype=float).ravel()
+    values = values[~np.isnan(values)]
+    reduced = {"n": len(values), "sum": np.sum(values), "sum_squares": np.dot(values, values), "min": np.min(values),
+               "max": np.max(values)}
+    if reduced["min"] > 0:
+        logs = np.log(values)
+        reduced["sum_logs"] = np.sum(logs)
+        reduced["sum_log_squares"] = np.dot(logs, logs)
+        if reduced["max"] < 1:
+            reduced["sum_log_complements"] = np.sum(np.log1p(-values))
+    if reduced["min"] >= 0 and np.all(values == np.floor(values)):
+        reduced["sum_log_factorials"] = np.sum(gammaln(values + 1))
+    return reduced
+
+
+@fitter("normal")
+def fit_normal(reduced):
+    n = reduced["n"]
+    mean = reduced["sum"] / n
+    variance = reduced["sum_squares"] / n - mean ** 2
+    if variance <= 0:
+        return None
+    return dists.Normal(mean, variance), -n / 2 * (np.log(2 * np.pi * variance) + 1)
+
+
+@fitter("lognormal")
+def fit_lognormal(reduced):
+    if "sum_logs" not in reduced:
+        return None
+    n = reduced["n"]
+    mu = reduced["sum_logs"] / n
+    variance = reduced["sum_log_squares"] / n - mu ** 2
+    if variance <= 0:
+        return None
+    return dists.Lognormal(mu, np.sqrt(variance)), -n / 2 * (np.log(2 * np.pi * variance) + 1) - reduced["sum_logs"]
+
+
+@fitter("exponential")
+def fit_exponential(reduced):
+    if reduced["min"] < 0 or reduced["sum"] <= 0:
+        return None
+    n = reduced["n"]
+    lam = n / reduced["sum"]
+    return dists.Exponential(lam), n * np.log(lam) - n
+
+
+# The shape k solves log(k) - digamma(k) = log(mean) - mean(log(x)), it is found by Newton's method starting at the
+# approximation of Minka (2002).
+@fitter("gamma")
+def fit_gamma(reduced):
+    if "sum_logs" not in reduced:
+        return None
+    n = reduced["n"]
+    mean = reduced["sum"] / n
+    s = np.log(mean) - reduced["sum_logs"] / n
+    if s <= 0:
+        return None
+    shape = (3 - s + np.sqrt((s - 3) ** 2 + 24 * s)) / (12 * s)
+    for i in range(newton_iterations):
+        step = (np.log(shape) - digamma(shape) - s) / (1 / shape - polygamma(1, shape))
+        shape = max(shape - step, shape / 2)
+        if abs(step) < 1e-12 * shape:
+            break
+    scale = mean / shape
+    log_likelihood = (shape - 1) * reduced["sum_logs"] - n * shape - n * shape * np.log(scale) - n * gammaln(shape)
+    return dists.Gamma(shape, scale), log_likelihood
+
+
+@fitter("uniform")
+def fit_uniform(reduced):
+    if reduced["max"] <= reduced["min"]:
+        return None
+    return dists.Uniform(reduced["min"], reduced["max"]), -reduced["n"] * np.log(reduced["max"] - reduced["min"])
+
+
+# Beta distribution on [0, 1], alpha and beta solve digamma(alpha) - digamma(alpha + beta) = mean(log(x)) and
+# digamma(beta) - digamma(alpha + beta) = mean(log(1 - x)), they are found by Newton's method starting at the method of
+# moments.
+@fitter("beta")
+def fit_beta(reduced):
+    if "sum_log_complements" not in reduced:
+        return None
+    n = reduced["n"]
+    mean = reduced["sum"] / n
+    variance = reduced["sum_squares"] / n - mean ** 2
+    if variance <= 0:
+        return None
+    target = np.array([reduced["sum_logs"], reduced["sum_log_complements"]]) / n
+    parameters = np.array([mean, 1 - mean]) * max(mean * (1 - mean) / variance - 1, 1e-3)
+    for i in range(newton_iterations):
+        total = np.sum(parameters)
+        residual = digamma(parameters) - digamma(total) - target
+        jacobian = np.diag(polygamma(1, parameters)) - polygamma(1, total)
+        step = np.linalg.solve(jacobian, residual)
+        parameters = np.maximum(parameters - step, parameters / 2)
+        if np.max(np.abs(step) / parameters) < 1e-12:
+            break
+    alpha, beta = parameters
+    log_likelihood = ((alpha - 1) * reduced["sum_logs"] + (beta - 1) * reduced["sum_log_complements"] -
+                      n * betaln(alpha, beta))
+    return dists.Beta(alpha, beta), log_likelihood
+
+
+@fitter("poisson")
+def fit_poisson(reduced):
+    if "sum_log_factorials" not in reduced or reduced["sum"] <= 0:
+        return None
+    n = reduced["n"]
+    lam = reduced["sum"] / n
+    return dists.Poisson(lam), reduced["sum"] * np.log(lam) - n * lam - reduced["sum_log_factorials"]
+
+
+# geometric distribution on 1, 2, 3, ... (number of trials up to the first success)
+@fitter("geometric")
+def fit_geometric(reduced):
+    if "sum_log_factorials" not in reduced or reduced["min"] < 1 or reduced["max"] <= 1:
+        return None
+    n = reduced["n"]
+    probability = n / reduced["sum"]
+    return dists.Geometric(probability), n * np.log(probability) + (reduced["sum"] - n) * np.log(1 - probability)
+
+
+# Fits all families of the registry to the "data" by maximum likelihood, computing the reductions of the data only once
+# (see reductions()), and ranks the fits by the Akaike information criterion AIC = 2k - 2 log L (or the Bayesian BIC =
+# k log n - 2 log L), k being the number of parameters of the family. Families not fitting the support of the data
+# (e.g. lognormal for data with values <= 0) are left out. The triangular, truncated normal and empirical families have
+# no maximum likelihood fit of the reductions and are not fitted. The likelihoods of the discrete families (fitted to
+# non-negative integer data only) are probabilities, not densities, so they are ranked among themselves, after the
+# continuous families.
+#
+# data:      the data (array of numbers or a QuantileSketch)
+# criterion: the criterion ranking the fits ("aic" or "bic")
+# returns:   the continuous fits ordered from the best to the worst followed by the discrete fits ordered the same way,
+#            each a dictionary with the "family", the fitted "distribution", whether it is "discrete", its
+#            "log_likelihood", the number of "parameters", "aic" and "bic"
+def fit_all(data, criterion="aic"):
+    reduced = reductions(data)
+    n = reduced["n"]
+    fits = []
+    if n < 2:
+        return fits
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for family in fitters:
+            result = fitters[family](reduced)
+            if result is None or not np.isfinite(result[1]):
+                continue
+            distribution, log_likelihood = result
+            k = len(distribution.keys) if family != "beta" else 2
+            fits.append({"family": family, "distribution": distribution, "discrete": family in discrete_families,
+                         "log_likelihood": log_likelihood, "parameters": k, "aic": 2 * k - 2 * log_likelihood,
+                         "bic": k * np.log(n) - 2 * log_likelihood})
+    return sorted(fits, key=lambda fit: (fit["discrete"], fit[criterion]))
+
+
+# Selects the fit of the "family" from the "fits", or for the family "best" the best continuous (or discrete) fit by the
+# "criterion".
+#
+# fits:      the fits, see fit_all()
+# family:    the name of the family or "best"
+# criterion: the criterion selecting the best fit ("aic" or "bic")
+# discrete:  if True "best" selects the best discrete fit instead of the best continuous fit
+# returns:   the fit or None if the family was not fitted
+def select(fits, family, criterion="aic", discrete=False):
+    if family == "best":
+        return min((fit for fit in fits if fit["discrete"] == discrete), key=lambda fit: fit[criterion], default=None)
+    for fit in fits:
+        if fit["family"] == family:
+            return fit
+    return None
@@ -0,0 +1,138 @@
+"""
+    Uncertainty-Analysis-Toolkit-for-Metos3d can be used to generate option files for Metos3d
+    and interpret Metos3d output data.
+    Copyright (C) 2022  Tom L. Hauschild
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+import numpy as np
+from scipy.spatial.distance import cdist
+
+
+# Generates "number" random Morris trajectories in the unit hypercube [0, 1]^k on a grid of "levels" levels. Every
+# trajectory consists of k + 1 points, each point differs from the previous one in exactly one coordinate by
+# delta = levels / (2 * (levels - 1)).
+#
+# number:    the number of trajectories
+# k:         the number of parameters
+# levels:    the number of grid levels (even)
+# generator: the numpy random generator to draw with
+# returns:   an array of the shape (number, k + 1, k)
+def generate_trajectories(number, k, levels, generator):
+    delta = levels / (2 * (levels - 1))
+    # strictly lower triangular matrix of ones, row i changes the first i coordinates
+    b = np.tril(np.ones((k + 1, k)), -1)
+    base = generator.integers(0, levels // 2, (number, 1, k)) / (levels - 1)
+    directions = generator.choice([-1.0, 1.0], (number, 1, k))
+    permutations = np.argsort(generator.random((number, k)), axis=1)
+
+    trajectories = base + (delta / 2) * ((2 * b - 1) * directions + 1)
+    return np.take_along_axis(trajectories, permutations[:, np.newaxis, :], axis=2)
+
+
+# Selects "r" of the "candidates" trajectories that spread out as far as possible in the unit hypercube. The distance
+# of two trajectories is the sum of the distances of all their points (Campolongo et al. 2007). Starting with all
+# candidates, the trajectory contributing the least to the sum of squared distances is removed until "r" are left. The
+# distances of the points are computed one trajectory at a time and the contributions are updated as candidates are
+# removed, so memory and time grow with the square of the number of candidates.
+#
+# candidates: the candidate trajectories, see generate_trajectories()
+# r:          the number of trajectories to select
+# returns:    the selected trajectories
+def select_trajectories(candidates, r):
+    number, points_per_trajectory, k = candidates.shape
+    points = candidates.reshape(-1, k)
+    distances = np.zeros((number, number))
+    for i in range(number):
+        point_distances = cdist(candidates[i], points).reshape(points_per_trajectory, number, points_per_trajectory)
+        distances[i] = np.sum(point_distances, axis=(0, 2)) ** 2
+
+    contributions = np.sum(distances, axis=1)
+    removed = np.zeros(number, dtype=bool)
+    for i in range(number - r):
+        worst = int(np.argmin(np.where(removed, np.inf, contributions)))
+        removed[worst] = True
+        contributions -= distances[:, worst]
+    return candidates[~removed]
+
+
+# Transforms the points of the unit hypercube to parameter values. The grid levels split the probability inside of
+# the bounds into "levels" equiprobable strata and level j = x * (levels - 1) of a parameter is mapped to the midpoint
+# of its stratum, the quantile cdf(lower_bound) + (j + 0.5) / levels * (cdf(upper_bound) - cdf(lower_bound)) of its
+# distribution. So the outermost levels stay inside of the bounds instead of falling onto them, where the
+# distribution may have no mass (or the model no meaningful output).
+#
+# unit:         the points in the unit hypercube (one per row)
+# levels:       the number of grid levels, see generate_trajectories()
+# marginals:    the distribution of every parameter
+# lower_bounds: the smallest value of every parameter
+# upper_bounds: the largest value of every parameter
+# returns:      the parameter values (one point per row)
+def scale(unit, levels, marginals, lower_bounds, upper_bounds):
+    values = np.zeros(unit.shape)
+    quantiles = (unit * (levels - 1) + 0.5) / levels
+    for i in range(len(marginals)):
+        lower = marginals[i].cdf(lower_bounds[i])
+        upper = marginals[i].cdf(upper_bounds[i])
+        values[:, i] = np.clip(marginals[i].ppf(lower + quantiles[:, i] * (upper - lower)), lower_bounds[i],
+                               upper_bounds[i])
+    return values
+
+
+# Calculates the elementary effects of every parameter and their statistics mu, mu* (mean of the absolute effects) and
+# sigma (standard deviation).
+#
+# unit:    the design points in the unit hypercube, trajectory after trajectory (shape: r * (k + 1), k)
+# outputs: the model output of every design point
+# returns: mu, mu*, sigma (one value per parameter) and the elementary effects (shape: r, k)
+def analyze(unit, outputs):
+    k = unit.shape[1]
+    unit = np.asarray(unit, dtype=float).reshape(-1, k + 1, k)
+    outputs = np.asarray(outputs, dtype=float).reshape(-1, k + 1)
+
+    steps = np.diff(unit, axis=1)
+    parameters = np.argmax(np.abs(steps), axis=2)
+    deltas = np.take_along_axis(steps, parameters[:, :, np.newaxis], axis=2)[:, :, 0]
+
+    effects = np.zeros((len(unit), k))
+    np.put_along_axis(effects, parameters, np.diff(outputs, axis=1) / deltas, axis=1)
+
+    return np.mean(effects, axis=0), np.mean(np.abs(effects), axis=0), np.std(effects, axis=0, ddof=1), effects
+
+
+# Writes the design to a csv file: one row per member with its trajectory, its point in the unit hypercube and its
+# parameter values.
+#
+# path:   the path of the csv file
+# unit:   the design points in the unit hypercube
+# values: the parameter values of the design points
+def write_design(path, unit, values):
+    k = unit.shape[1]
+    with open(path, "w") as file_stream:
+        writer = csv.writer(file_stream)
+        writer.writerow(["member", "trajectory"] + ["u" + str(i) for i in range(k)] + ["D" + str(i) for i in range(k)])
+        for member in range(len(unit)):
+            writer.writerow([member, member // (k + 1)] + list(unit[member]) + list(values[member]))
+
+
+# Reads a design written by write_design().
+#
+# path:    the path of the csv file
+# returns: the design points in the unit hypercube and the parameter values
+def read_design(path):
+    data = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    k = (data.shape[1] - 2) // 2
+    return data[:, 2:2 + k], data[:, 2 + k:]
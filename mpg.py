@@ -17,13 +17,22 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import os
+import re
+import shlex
 import sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import yaml
 from colorama import Fore
 import hist4cmd as hist
+import distributions as dists
 import statistics as stats
 import csv
+import itertools
+import sqlite3
+import morris
+from store import EnsembleStore
 
 # notice
 notice = "Metos3D-Parameter-Generator Copyright (C) 2022 Tom L. Hauschild.\nThis program comes with ABSOLUTELY NO " \
@@ -36,20 +45,19 @@ indicator_key_not_found = "Error: Indicator key not found, continuing without se
 
 # distribution variable
 variable = "%Di%"
-config_dir = "resources/config.yaml"
-
-# arguments passed to the program
-debug = False
-quiet = False
-print_array = False
-display_histogram = False
-histogram_height = 15
-histogram_width = 3
-histogram_spacing = 1
-histogram_buckets = 15
+
+# number of values drawn from one random stream, the design only depends on the seed and this size (not on the number of
+# workers), so it has to stay the same to reproduce a design
+default_chunk_size = 4096
+# the stream indices of a joint and a Morris design, distinct from the indices of the distributions
+joint_stream = 2 ** 16
+morris_stream = 2 ** 16 + 1
+# the file of the output directory the seed of a generation is written to, so designs without a configured seed can be
+# reproduced
+seed_file_name = "seed.txt"
 
 # dictionary for option file indicators -> their replacements (init: standard values)
-indicator_replacements = {
+default_indicator_replacements = {
     # debug
     "%Metos3dDebugLevel%": "3",
     "%Metos3DGeometryType%": "Profile",
@@ -114,6 +122,112 @@ indicator_replacements = {
 }
 
 
+# Raised instead of exiting the program if a generation or an analysis fails, so the toolkit can be used from a
+# long-lived process. The command line interfaces print the message and exit.
+class ToolkitError(Exception):
+    pass
+
+
+# Prints the messages of the toolkit. Every generator and analyzer has a printer of its own, so several of them with
+# different output settings can be used in one process.
+class Printer:
+
+    # quiet: disable all outputs
+    # debug: enable debug messages
+    def __init__(self, quiet=False, debug=False):
+        self.quiet = quiet
+        self.debug_enabled = debug
+
+    # Print an error message with the content "message".
+    #
+    # message: the message to print
+    def error(self, message):
+        if not self.quiet:
+            print(Fore.RED + "[ERROR] " + message + Fore.RESET)
+
+    # Print a warning message with the content "message".
+    #
+    # message: the message to print
+    def warning(self, message):
+        if not self.quiet:
+            print(Fore.YELLOW + "[WARNING] " + message + Fore.RESET)
+
+    # Print a debug message with the content "message".
+    #
+    # message: the message to print
+    def debug(self, message):
+        if self.debug_enabled:
+            print(Fore.BLUE + "[DEBUG] " + Fore.RESET + message + Fore.RESET)
+
+    # Print a success message with the content "message".
+    #
+    # message: the message to print
+    def success(self, message):
+        if not self.quiet:
+            print(Fore.GREEN + "[SUCCESS] " + message + Fore.RESET)
+
+    # Print an info message with the content "message".
+    def info(self, message):
+        if not self.quiet:
+            print(Fore.CYAN + "[INFO] " + Fore.RESET + message)
+
+    # Prints a separator message using the character "-".
+    def seperator(self):
+        if not self.quiet:
+            print("------------------------------------------------------------------------------")
+
+    # Prints a separator message using the character "=".
+    def double_seperator(self):
+        if not self.quiet:
+            print("==============================================================================")
+
+
+# the printer of the command line interfaces, used by the print_* functions
+default_printer = Printer()
+
+
+# The configuration of a generation: the yaml data of the config file and the arguments passed to the program. The
+# yaml data is never changed, so a config can be used for any number of generations.
+class GeneratorConfig:
+
+    # yaml_data:         the content of the config file
+    # print_array:       print all generated parameters after generating them
+    # display_histogram: display a histogram of the generated values
+    # histogram_height:  the height of the histogram in characters
+    # histogram_width:   the number of characters a single bar of the histogram is wide
+    # histogram_spacing: the number of spaces between the bars of the histogram
+    # histogram_buckets: the number of buckets used in the histogram
+    # workers:           the number of processes used to generate the random values
+    def __init__(self, yaml_data, print_array=False, display_histogram=False, histogram_height=15, histogram_width=3,
+                 histogram_spacing=1, histogram_buckets=15, workers=1):
+        self.yaml_data = yaml_data
+        self.print_array = print_array
+        self.display_histogram = display_histogram
+        self.histogram_height = histogram_height
+        self.histogram_width = histogram_width
+        self.histogram_spacing = histogram_spacing
+        self.histogram_buckets = histogram_buckets
+        self.workers = workers
+
+    # Reads the config file "path" and creates a config of it.
+    #
+    # path:      the path of the config.yaml
+    # arguments: the arguments passed to the program, see __init__()
+    # returns:   the config
+    @classmethod
+    def from_file(cls, path, **arguments):
+        return cls(read_yaml_file(path), **arguments)
+
+    # Uses the "model" section of the yaml data to replace the default values of the option file indicators.
+    #
+    # returns: the dictionary option file indicator -> its replacement
+    def indicator_replacements(self):
+        replacements = dict(default_indicator_replacements)
+        for key in self.yaml_data.get("model") or {}:
+            replacements["%" + key + "%"] = self.yaml_data["model"][key]
+        return replacements
+
+
 # Writes the option files to the directory "filepath" replacing the variables with its indented values.
 #
 # filepath:              the directory to write the option files to
@@ -132,8 +246,7 @@ def write_option_file(filepath, option_file_content, variable_replacements, inde
             file_stream.write(option_file_content)
             file_stream.close()
     except FileExistsError:
-        print_error(option_read_error + filepath + "'")
-        sys.exit(0)
+        raise ToolkitError(option_read_error + filepath + "'")
 
 
 # Writes the "content" to the file "filepath".
@@ -157,6 +270,25 @@ def write_csv_file(filepath, data):
         file_stream.close()
 
 
+# Writes the data to the positions "first" to "first" + len(data) - 1 of the row of a csv file written by
+# write_csv_file(), e.g. the values of a batch of a sequential design. Values at other positions are kept, so a batch
+# can be generated again or out of order, missing positions before "first" are filled with NaN. The file is created if
+# it does not exist.
+#
+# filepath: the file to write to
+# data:     the data to write
+# first:    the position of the first value
+def write_csv_slice(filepath, data, first):
+    row = []
+    try:
+        with open(filepath) as file_stream:
+            row = next(csv.reader(file_stream), [])
+    except FileNotFoundError:
+        pass
+    row = row + ["nan"] * (first - len(row))
+    write_csv_file(filepath, row[:first] + list(data) + row[first + len(data):])
+
+
 # Reads and returns the option file.
 
 # returns: the option file content
@@ -167,31 +299,33 @@ def read_option_file(path):
             file_stream.close()
             return lines
     except FileNotFoundError:
-        print_error(option_read_error + path + "'")
-        sys.exit(0)
+        raise ToolkitError(option_read_error + path + "'")
 
 
 # Reads and returns the config file.
-
+#
+# path:    the path of the config file
 # returns: the config file content
-def read_yaml_file():
-    with open(config_dir) as fileStream:
-        try:
+def read_yaml_file(path):
+    try:
+        with open(path) as fileStream:
             loaded = yaml.safe_load(fileStream)
-        except yaml.YAMLError as exception:
-            print(exception)
-            sys.exit(0)
+    except (OSError, yaml.YAMLError) as exception:
+        raise ToolkitError("Couldn't read config file: '" + path + "': " + str(exception))
 
-    if loaded:
-        return loaded
+    if not loaded:
+        raise ToolkitError("The config file is empty: '" + path + "'")
+    return loaded
 
 
 # Replaces all indicators in "lines" and replaces '%i%' with the "index" of the option file.
 #
-# lines:   the lines to replace the indicators in
-# index:   the index of the option file
-# returns: the lines with the replaced indicators
-def replace_indicators(lines, index):
+# lines:                  the lines to replace the indicators in
+# index:                  the index of the option file
+# indicator_replacements: the dictionary option file indicator -> its replacement, see
+#                         GeneratorConfig.indicator_replacements()
+# returns:                the lines with the replaced indicators
+def replace_indicators(lines, index, indicator_replacements):
     string = ""
     for line in lines:
         for indicator in indicator_replacements:
@@ -203,72 +337,90 @@ def replace_indicators(lines, index):
     return string
 
 
-# Uses yaml data to replace the default values in the dictionary "indicator_replacements".
+# Splits the option file into the lines that are the same for every member (comments included) and the option lines
+# that vary between the members, i.e. the lines containing a distribution variable or the member index %i% once all
+# indicators are replaced.
 #
-# yaml_data: the yaml data to use to replace the default values
-def set_data_from_yaml(yamlData):
-    for key in yamlData["model"]:
-        alt_key = "%" + key + "%"
-        if alt_key in indicator_replacements:
-            indicator_replacements[alt_key] = yamlData["model"][key]
+# lines:                  the lines of the option file
+# indicator_replacements: the dictionary option file indicator -> its replacement, see
+#                         GeneratorConfig.indicator_replacements()
+# returns:                the content of the shared option file and the list of varying lines
+def split_option_file(lines, indicator_replacements):
+    shared, varying = "", []
+    for line in replace_indicators(lines, "%i%", indicator_replacements).splitlines(keepends=True):
+        is_option = line.strip() != "" and not line.lstrip().startswith("#")
+        if is_option and ("%i%" in line or re.search(variable.replace("i", r"\d+"), line)):
+            varying.append(line)
         else:
-            indicator_replacements.update({alt_key : yamlData["model"][key]})
+            shared += line
+    return shared, varying
+
+
+# Replaces the member index and the distribution variables in the varying option lines of a member.
+#
+# varying:               the varying lines, see split_option_file()
+# member:                the index of the member
+# variable_replacements: the values of every distribution
+# index:                 the index of the value of the member in every distribution
+# returns:               the lines of the member
+def member_lines(varying, member, variable_replacements, index):
+    lines = []
+    for line in varying:
+        line = line.replace("%i%", str(member))
+        for i in range(len(variable_replacements)):
+            line = line.replace(variable.replace("i", str(i)), str(variable_replacements[i][index[i]]))
+        lines.append(line)
+    return lines
 
 
 # Print an error message with the content "message".
 #
 # message: the message to print
 def print_error(message):
-    if not quiet:
-        print(Fore.RED + "[ERROR] " + message + Fore.RESET)
+    default_printer.error(message)
 
 
 # Print a warning message with the content "message".
 #
 # message: the message to print
 def print_warning(message):
-    if not quiet:
-        print(Fore.YELLOW + "[WARNING] " + message + Fore.RESET)
+    default_printer.warning(message)
 
 
 # Print a debug message with the content "message".
 #
 # message: the message to print
 def print_debug(message):
-    if debug:
-        print(Fore.BLUE + "[DEBUG] " + Fore.RESET + message + Fore.RESET)
+    default_printer.debug(message)
 
 
 # Print a success message with the content "message".
 #
 # message: the message to print
 def print_success(message):
-    if not quiet:
-        print(Fore.GREEN + "[SUCCESS] " + message + Fore.RESET)
+    default_printer.success(message)
 
 
 # Print an info message with the content "message".
 def print_info(message):
-    if not quiet:
-        print(Fore.CYAN + "[INFO] " + Fore.RESET + message)
+    default_printer.info(message)
 
 
 # Prints a separator message using the character "-".
 def print_seperator():
-    if not quiet:
-        print("------------------------------------------------------------------------------")
+    default_printer.seperator()
 
 
 # Prints a separator message using the character "=".
 def print_double_seperator():
-    if not quiet:
-        print("==============================================================================")
+    default_printer.double_seperator()
 
 
 # Generates a string with mpirun commands using yaml data.
 #
 # yamlData: the yaml data to use to generate the mpirun commands
-# names:    the names of the option to be included in the mpirun commands
+# names:    the names of the option files to be included in the mpirun commands (followed by the varying options of the
+#           member if the option file is shared)
 # returns:  the string with the mpirun commands
 def generate_mpirun(yaml_data, names):
     program_path = yaml_data["mpirun"]["program_path"]
@@ -282,163 +434,751 @@ def generate_mpirun(yaml_data, names):
     return arguments[0:len(arguments) - 1]
 
 
-# The main function. It generates all files and data depending on the configuration by the config file and arguments
-# passed to the program.
-def generate_option_files():
-    yaml_data = read_yaml_file()
-    number_of_distributions = yaml_data["distributions"]["number"]
-    file_name = yaml_data["file_name"]
-    output_directory = yaml_data["output_directory"]
-
-    value_array = [0 for i in range(number_of_distributions)]
-
-    for i in range(number_of_distributions):
-        value_array[i] = generate_random_parameter(i, yaml_data)
-        if display_histogram:
-            print_info("Histogram of D" + str(i) + ": ")
-            print()
-            hist.display_histogram(value_array[i], histogram_buckets, histogram_height, histogram_width,
-                                   histogram_spacing)
-            print_double_seperator()
-        if yaml_data["distributions"]["D" + str(i)]["save_in_csv"]:
-            print_debug("Saving D" + str(i) + " in csv file: ")
-            write_csv_file(output_directory + "D" + str(i) + ".csv", value_array[i])
-            print_info("Saved D" + str(i) + " in csv file: " + output_directory + "D" + str(i) + ".csv")
-
-    set_data_from_yaml(yaml_data)
-    option_file_path = yaml_data["option_file_path"]
-    content = read_option_file(option_file_path)
-
-    sample_size = len(value_array[0])
-    if number_of_distributions >= 2:
-        sample_size *= len(value_array[1])
-    elif number_of_distributions >= 3:
-        sample_size *= len(value_array[2])
-
-    option_file_names = [0 for i in range(sample_size)]
-
-    k = 0
-    while k == 0 or (number_of_distributions >= 3 and k < len(value_array[2])):
-        j = 0
-        while j == 0 or (number_of_distributions >= 2 and j < len(value_array[1])):
-            for i in range(len(value_array[0])):
-                option_file_name = file_name + str(i) + "-" + str(j) + "-" + str(k) + ".txt"
-                len1 = 0
-                len2 = 0
-                if number_of_distributions >= 2:
-                    len1 = len(value_array[1])
-                if number_of_distributions >= 3:
-                    len2 = len(value_array[2])
-
-                index = (k * len2)+(j * len1)+i
-                option_file_names[index] = option_file_name
-                write_option_file(output_directory + option_file_name, replace_indicators(content, i), value_array,
-                                  [i, j, k])
-            j += 1
-        k += 1
-
-    # generate command arguments
-    if yaml_data["mpirun"]["generate"]:
-        print_debug("Generating mpirun commands... ")
-        write_txt_file(output_directory + "mpirun.txt", generate_mpirun(yaml_data, option_file_names))
-        print_info("Generated mpirun commands: " + output_directory + "mpirun.txt")
-
-    print_success("Option files generated.")
-
-
-# Generates random values from the distributions configured by the yaml_data. The function then prints out attributes
-# of the distributions of the generated values (i.a. expected values, variances and the deltas / differences between
-# generated and entered parameters)
+# Returns the number of processes set by "-np" (or "-n") in the mpirun options, 1 if not set.
 #
-# distribution_index: the index of the distribution to generate the values for
-# yaml_data:          the yaml data to use to generate the random values
-# returns:            the array with the generated values
-def generate_random_parameter(distribution_index, yaml_data):
-    print_info("Generating random parameter values for distribution D" + str(distribution_index) + "...")
-
-    distribution_type = yaml_data["distributions"]["D" + str(distribution_index)]["type"]
-    lower_bound = yaml_data["distributions"]["D" + str(distribution_index)]["lower_bound"]
-    upper_bound = yaml_data["distributions"]["D" + str(distribution_index)]["upper_bound"]
-    sample_size = yaml_data["distributions"]["D" + str(distribution_index)]["sample_size"]
-    tries = yaml_data["distributions"]["D" + str(distribution_index)]["tries"]
-    value_on_fail = yaml_data["distributions"]["D" + str(distribution_index)]["value_on_fail"]
-
-    parameter_array = [0 for i in range(sample_size)]
-    number_of_failed_generations = 0
-
-    for i in range(sample_size):
-        new_parameter = 0
-        for j in range(tries):
-            if distribution_type == "lognormal":
-                new_parameter = np.random.lognormal(yaml_data["distributions"]["D" + str(distribution_index)]["mu"],
-                                                    yaml_data["distributions"]["D" + str(distribution_index)][
-                                                        "sigma"])
-            elif distribution_type == "normal":
-                new_parameter = np.random.normal(yaml_data["distributions"]["D" + str(distribution_index)]["mean"],
-                                                 yaml_data["distributions"]["D" + str(distribution_index)]["variance"])
-            elif distribution_type == "geometric":
-                new_parameter = np.random.geometric(
-                    yaml_data["distributions"]["D" + str(distribution_index)]["probability"])
-            elif distribution_type == "poisson":
-                new_parameter = np.random.poisson(yaml_data["distributions"]["D" + str(distribution_index)]["lambda"])
-            elif distribution_type == "exponential":
-                new_parameter = np.random.exponential(
-                    yaml_data["distributions"]["D" + str(distribution_index)]["lambda"])
-            elif distribution_type == "uniform":
-                new_parameter = np.random.uniform(yaml_data["distributions"]["D" + str(distribution_index)]["lower"],
-                                                  yaml_data["distributions"]["D" + str(distribution_index)]["upper"])
-            else:
-                print_error("Distribution type not found: " + distribution_type)
-                exit(1)
-
-            if lower_bound <= new_parameter <= upper_bound:
-                parameter_array[i] = new_parameter
-                break
-
-        if not (lower_bound <= new_parameter <= upper_bound):
-            number_of_failed_generations += 1
-            parameter_array[i] = value_on_fail
-            print_debug("Failed to generate value for parameter " + str(i) + ": " + str(new_parameter))
-            if number_of_failed_generations == sample_size:
-                print_error("Failed to generate all parameter values. Exiting.")
-                exit(1)
-
-    if print_array:
-        print_info("Generated values for distribution D" + str(distribution_index) + ": " + str(parameter_array))
-
-    if not (number_of_failed_generations == 0):
-        print_warning("Values for distribution D" + str(distribution_index) + " generated. Failed to generate " +
-                      str(number_of_failed_generations) + " parameters after " + str(tries) +
-                      " tries. They will be set to " + str(value_on_fail) + ".")
+# options: the mpirun options or a whole command
+# returns: the number of processes
+def get_number_of_processes(options):
+    match = re.search(r"(?:^|\s)-(?:np|n)\s+(\d+)", options)
+    if match is None:
+        return 1
+    return int(match.group(1))
+
+
+# Generates an array job script for the batch scheduler SLURM or PBS and the file mapping every array task to its
+# option files. The members are packed into as few tasks as possible: every task allocates "nodes" nodes with
+# "cores_per_node" cores, runs as many members at once as fit with the "-np" of the mpirun options and runs
+# "members_per_task" members in total (default: one wave of members). Members running at once must not share cores:
+# SLURM places them with srun --exact, under PBS every member gets the hosts of its own "-np" processes of
+# $PBS_NODEFILE ($hostfile) and mpirun does not bind them, since concurrent mpirun calls would all bind to the same
+# first cores of a node.
+#
+# yaml_data: the yaml data, containing the "scheduler" section
+# names:     the names of the option files (followed by the varying options of the member if the option file is shared)
+# returns:   the job script, the content of the mapping file, the number of tasks and the number of members per wave
+def generate_job_script(yaml_data, names):
+    scheduler = yaml_data["scheduler"]
+    scheduler_type = scheduler.get("type", "slurm")
+    optionfiles_path = yaml_data["mpirun"]["optionfiles_path"]
+    program_path = yaml_data["mpirun"]["program_path"]
+    processes = get_number_of_processes(yaml_data["mpirun"]["options"])
+    nodes = scheduler.get("nodes", 1)
+    cores_per_node = scheduler["cores_per_node"]
+
+    slots = max(1, nodes * cores_per_node // processes)
+    members_per_task = scheduler.get("members_per_task", slots)
+    tasks = int(np.ceil(len(names) / members_per_task))
+    mapping_path = optionfiles_path + "jobs.txt"
+    mapping = "\n".join(str(member // members_per_task) + " " + optionfiles_path + names[member]
+                         for member in range(len(names)))
+
+    array = "0-" + str(tasks - 1)
+    if "max_concurrent" in scheduler:
+        array += "%" + str(scheduler["max_concurrent"])
+
+    if scheduler_type == "slurm":
+        launcher = scheduler.get("launcher", "srun --exact --ntasks=" + str(processes))
+        task_variable = "SLURM_ARRAY_TASK_ID"
+        prepare = ""
+        header = ["#SBATCH --job-name=" + scheduler.get("job_name", "metos3d"),
+                  "#SBATCH --nodes=" + str(nodes),
+                  "#SBATCH --ntasks-per-node=" + str(cores_per_node),
+                  "#SBATCH --time=" + scheduler.get("walltime", "24:00:00"),
+                  "#SBATCH --array=" + array]
+        if "partition" in scheduler:
+            header.append("#SBATCH --partition=" + scheduler["partition"])
+        if "account" in scheduler:
+            header.append("#SBATCH --account=" + scheduler["account"])
+    elif scheduler_type == "pbs":
+        launcher = scheduler.get("launcher", "mpirun --hostfile \"$hostfile\" --bind-to none " +
+                                 yaml_data["mpirun"]["options"])
+        task_variable = "PBS_ARRAY_INDEX"
+        # $PBS_NODEFILE holds one line per process, the slot of the member gets its own "processes" lines
+        first_line = "$((i % " + str(slots) + " * " + str(processes) + " + 1))"
+        last_line = "$((i % " + str(slots) + " * " + str(processes) + " + " + str(processes) + "))"
+        prepare = "    hostfile=\"${TMPDIR:-/tmp}/hosts.$PBS_JOBID.$((i % " + str(slots) + "))\"\n" + \
+                  "    sed -n \"" + first_line + "," + last_line + "p\" \"$PBS_NODEFILE\" > \"$hostfile\"\n"
+        header = ["#PBS -N " + scheduler.get("job_name", "metos3d"),
+                  "#PBS -l select=" + str(nodes) + ":ncpus=" + str(cores_per_node) + ":mpiprocs=" +
+                  str(cores_per_node),
+                  "#PBS -l walltime=" + scheduler.get("walltime", "24:00:00"),
+                  "#PBS -J " + array]
+        if "partition" in scheduler:
+            header.append("#PBS -q " + scheduler["partition"])
+        if "account" in scheduler:
+            header.append("#PBS -A " + scheduler["account"])
     else:
-        print_success("Random parameter values for distribution D" + str(distribution_index) + " successfully "
-                                                                                               "generated.")
-    if distribution_type == "lognormal":
-        mu = yaml_data["distributions"]["D" + str(distribution_index)]["mu"]
-        sigma = yaml_data["distributions"]["D" + str(distribution_index)]["sigma"]
-        anticipated_values = stats.lognorm_values(mu, sigma)
-        estimated_values = stats.estimate_lognorm_data_values(parameter_array)
-
-        print_double_seperator()
-        print_info("Anticipated values for distribution D" + str(distribution_index) + ": ")
-        print_double_seperator()
-        print_info("used mu:\t\t\t" + str(mu))
-        print_info("used sigma:\t\t" + str(sigma))
-        print_info("expected value:\t\t" + str(anticipated_values[0]))
-        print_info("expected variance:\t" + str(anticipated_values[1]))
-        print_seperator()
-        print_info("estimated mu:\t\t" + str(estimated_values[0]))
-        print_info("estimated sigma:\t\t" + str(estimated_values[1]))
-        print_info("estimated expected value:" + str(estimated_values[2]))
-        print_info("estimated variance:\t" + str(estimated_values[3]))
-        print_seperator()
-        print_info("mu delta:\t\t" + str(np.absolute(mu - estimated_values[0])))
-        print_info("sigma delta:\t\t" + str(np.absolute(sigma - estimated_values[1])))
-        print_info("expected value delta:\t" + str(np.absolute(anticipated_values[0] - estimated_values[2])))
-        print_info("variance delta:\t\t" + str(np.absolute(anticipated_values[1] - estimated_values[3])))
-        print_double_seperator()
-
-    return parameter_array
+        raise ToolkitError("Scheduler type not found: " + str(scheduler_type))
+
+    script = "#!/bin/bash\n" + "\n".join(header) + "\n\n" + \
+             "# runs the members of this array task, " + str(slots) + " at a time\n" + \
+             "i=0\n" + \
+             "while read -r arguments <&3; do\n" + \
+             prepare + \
+             "    " + launcher + " " + program_path + " $arguments &\n" + \
+             "    i=$((i + 1))\n" + \
+             "    if [ $((i % " + str(slots) + ")) -eq 0 ]; then\n" + \
+             "        wait\n" + \
+             "    fi\n" + \
+             "done 3< <(awk -v task=\"$" + task_variable + "\" '$1 == task {$1 = \"\"; print substr($0, 2)}' " + \
+             mapping_path + ")\n" + \
+             "wait\n"
+
+    return script, mapping, tasks, slots
+
+
+# Generates the option files, parameter csv files, mpirun commands and job scripts of a design. A generator only keeps
+# state of its own (config, printer and the seed of its last generation), so any number of generations can run in one
+# long-lived process.
+class OptionFileGenerator:
+
+    # config:  the GeneratorConfig of the generation
+    # printer: the Printer of the messages (default: quiet)
+    def __init__(self, config, printer=None):
+        self.config = config
+        self.printer = printer
+        if printer is None:
+            self.printer = Printer(quiet=True)
+        # the seed of the last generation, see get_seed()
+        self.seed = None
+
+    # Generates all files and data depending on the configuration.
+    #
+    # batch:   the index of the batch of a sequential design to generate, see first_member_of_batch() (None generates
+    #          the whole design)
+    # returns: the names of the option files (followed by the varying options of the member if the option file is
+    #          shared) and the generated values of every distribution
+    def generate(self, batch=None):
+        yaml_data = self.config.yaml_data
+        number_of_distributions = yaml_data["distributions"]["number"]
+        file_name = yaml_data["file_name"]
+        output_directory = yaml_data["output_directory"]
+        mode = yaml_data["distributions"].get("mode", "product")
+        first_member = 0
+        if batch is not None:
+            first_member = self.first_member_of_batch(batch)
+        seed = self.get_seed(batch)
+        write_txt_file(output_directory + seed_file_name, str(seed) + "\n")
+
+        if mode == "product":
+            value_array = [self.generate_random_parameter(i, seed) for i in range(number_of_distributions)]
+        elif mode == "joint":
+            value_array = self.generate_joint_parameters(seed, batch)
+        elif mode == "morris":
+            value_array = self.generate_morris_parameters(seed)
+        else:
+            raise ToolkitError("Sampling mode not found: " + str(mode))
+
+        for i in range(number_of_distributions):
+            if self.config.display_histogram and not self.printer.quiet:
+                self.printer.info("Histogram of D" + str(i) + ": ")
+                print()
+                hist.display_histogram(value_array[i], self.config.histogram_buckets, self.config.histogram_height,
+                                       self.config.histogram_width, self.config.histogram_spacing)
+                self.printer.double_seperator()
+            if yaml_data["distributions"]["D" + str(i)]["save_in_csv"]:
+                self.printer.debug("Saving D" + str(i) + " in csv file: ")
+                if batch is None:
+                    write_csv_file(output_directory + "D" + str(i) + ".csv", value_array[i])
+                else:
+                    write_csv_slice(output_directory + "D" + str(i) + ".csv", value_array[i], first_member)
+                self.printer.info("Saved D" + str(i) + " in csv file: " + output_directory + "D" + str(i) + ".csv")
+
+        indicator_replacements = self.config.indicator_replacements()
+        content = read_option_file(yaml_data["option_file_path"])
+
+        option_file_names, indices = generate_members(mode, file_name, value_array, first_member)
+        bundle = yaml_data.get("bundle", "files")
+        if bundle == "files":
+            for member in range(len(option_file_names)):
+                write_option_file(output_directory + option_file_names[member],
+                                  replace_indicators(content, first_member + member, indicator_replacements),
+                                  value_array, indices[member])
+        elif bundle == "shared":
+            option_file_names = self.write_shared_option_file(content, indicator_replacements, value_array, indices,
+                                                              first_member)
+        else:
+            raise ToolkitError("Bundle type not found: " + str(bundle))
+
+        # write the members to the ensemble store
+        if yaml_data.get("store"):
+            self.printer.debug("Writing ensemble store... ")
+            output_file = str(indicator_replacements["%Metos3DTracerOutputFile%"])
+            output_files = [output_file.replace("%i%", str(first_member + member))
+                            for member in range(len(option_file_names))]
+            try:
+                with EnsembleStore(yaml_data["store"]) as ensemble_store:
+                    ensemble_store.write_members(option_file_names, output_files, value_array, indices, first_member,
+                                                  batch is None)
+            except sqlite3.Error as exception:
+                raise ToolkitError("Couldn't write ensemble store: '" + yaml_data["store"] + "': " + str(exception))
+            self.printer.info("Wrote " + str(len(option_file_names)) + " members to the ensemble store: " +
+                              yaml_data["store"])
+
+        # generate command arguments
+        if yaml_data["mpirun"]["generate"]:
+            self.printer.debug("Generating mpirun commands... ")
+            write_txt_file(output_directory + "mpirun.txt", generate_mpirun(yaml_data, option_file_names))
+            self.printer.info("Generated mpirun commands: " + output_directory + "mpirun.txt")
+
+        # generate batch scheduler job files
+        if "scheduler" in yaml_data and yaml_data["scheduler"].get("generate", False):
+            self.printer.debug("Generating job script... ")
+            script, mapping, tasks, slots = generate_job_script(yaml_data, option_file_names)
+            script_path = output_directory + "job." + yaml_data["scheduler"].get("type", "slurm")
+            write_txt_file(script_path, script)
+            write_txt_file(output_directory + "jobs.txt", mapping)
+            self.printer.info("Generated job script: " + script_path + " (" + str(len(option_file_names)) +
+                              " members in " + str(tasks) + " array tasks, " + str(slots) +
+                              " members at a time per task)")
+
+        if batch is not None:
+            self.printer.success("Option files of batch " + str(batch) + " (members " + str(first_member) + " to " +
+                                 str(first_member + len(option_file_names) - 1) + ") generated.")
+            return option_file_names, value_array
+        self.printer.success("Option files generated.")
+        return option_file_names, value_array
+
+    # Estimates the cost of the design without drawing any values or writing any files: the number of members, the
+    # expected number of failed generations of every distribution (values still out of bounds after all tries), the
+    # bytes of the option files, the number of files (inodes) written by the generation and by the runs and the
+    # core-hours of the runs, i.e. members * -np * Metos3DSpinupCount * seconds per spin-up year.
+    #
+    # batch:                   the index of the batch of a sequential design, see first_member_of_batch()
+    # seconds_per_spinup_year: the wall-clock seconds one spin-up year of a member takes with the -np of the mpirun
+    #                          options (default: "seconds_per_spinup_year" of the config), e.g. a duration measured by
+    #                          runner.py divided by the Metos3DSpinupCount of the run
+    # returns:                 a dictionary of the estimates, the core-hours are None without seconds per spin-up year
+    def estimate_cost(self, batch=None, seconds_per_spinup_year=None):
+        yaml_data = self.config.yaml_data
+        distributions_config = yaml_data["distributions"]
+        number_of_distributions = distributions_config["number"]
+        mode = distributions_config.get("mode", "product")
+        first_member = 0
+        if batch is not None:
+            first_member = self.first_member_of_batch(batch)
+        members = number_of_members(yaml_data, batch)
+        configs = [distributions_config["D" + str(i)] for i in range(number_of_distributions)]
+        try:
+            marginals = [dists.from_config(config) for config in configs]
+        except KeyError as exception:
+            raise ToolkitError(str(exception.args[0]))
+
+        # a value fails if all its tries are out of bounds, joint vectors are redrawn as a whole
+        out_of_bounds = [dists.out_of_bounds_probability(marginals[i], configs[i]["lower_bound"],
+                                                         configs[i]["upper_bound"]) for i in range(len(configs))]
+        if mode == "product":
+            failed = [configs[i]["sample_size"] * out_of_bounds[i] ** configs[i]["tries"] for i in range(len(configs))]
+        elif mode == "joint":
+            correlation, cholesky = correlation_cholesky(distributions_config)
+            if np.allclose(correlation, np.identity(number_of_distributions)):
+                vector_out_of_bounds = 1 - np.prod([1 - p for p in out_of_bounds])
+            else:
+                pilot = dists.sample_gaussian_copula(marginals, cholesky, default_chunk_size * 16,
+                                                     np.random.default_rng(0))
+                vector_out_of_bounds = np.mean(np.any((pilot < [config["lower_bound"] for config in configs]) |
+                                                      (pilot > [config["upper_bound"] for config in configs]), axis=1))
+            tries = max(config["tries"] for config in configs)
+            failed = [members * vector_out_of_bounds ** (tries - 1) * p for p in out_of_bounds]
+        else:
+            # Morris designs are scaled into the bounds
+            failed = [0.0] * number_of_distributions
+
+        # the option file of a member holds the shared lines and its varying lines, see write_shared_option_file()
+        indicator_replacements = self.config.indicator_replacements()
+        shared, varying = split_option_file(read_option_file(yaml_data["option_file_path"]), indicator_replacements)
+        varying = "".join(varying)
+        variables = [variable.replace("i", str(i)) for i in range(number_of_distributions)]
+        lengths = [value_length(marginals[i], configs[i]["lower_bound"], configs[i]["upper_bound"])
+                   for i in range(number_of_distributions)]
+        varying_bytes = (members * (len(varying) - 3 * varying.count("%i%") -
+                                    sum(varying.count(name) * len(name) for name in variables)) +
+                         varying.count("%i%") * index_digits(first_member, members) +
+                         members * sum(varying.count(variables[i]) * lengths[i]
+                                       for i in range(number_of_distributions)))
+        bundle = yaml_data.get("bundle", "files")
+        if bundle == "files":
+            option_files = members
+            option_file_bytes = members * len(shared) + varying_bytes
+        elif bundle == "shared":
+            option_files = 1
+            option_file_bytes = len(shared)
+        else:
+            raise ToolkitError("Bundle type not found: " + str(bundle))
+
+        # files of the generation, the files besides the option files already exist for a further batch
+        files = option_files
+        if first_member == 0:
+            files += sum(1 for config in configs if config["save_in_csv"])
+            files += int(bool(yaml_data.get("store"))) + int(bool(yaml_data["mpirun"]["generate"])) + \
+                int(mode == "morris")
+            if "scheduler" in yaml_data and yaml_data["scheduler"].get("generate", False):
+                files += 2
+        output_files = members * int(indicator_replacements["%Metos3DTracerCount%"])
+
+        processes = get_number_of_processes(yaml_data["mpirun"]["options"])
+        spinup_years = int(indicator_replacements["%Metos3DSpinupCount%"])
+        if seconds_per_spinup_year is None:
+            seconds_per_spinup_year = yaml_data.get("seconds_per_spinup_year")
+        core_hours = None
+        if seconds_per_spinup_year is not None:
+            core_hours = members * processes * spinup_years * seconds_per_spinup_year / 3600
+
+        self.printer.double_seperator()
+        self.printer.info("Estimated cost of the " + mode + " design" +
+                          ("" if batch is None else " (batch " + str(batch) + ")") + ":")
+        self.printer.double_seperator()
+        self.printer.info("members:\t\t\t" + str(members))
+        for i in range(number_of_distributions):
+            self.printer.info("expected failed D" + str(i) + ":\t\t" + str(failed[i]) + " (out of bounds: " +
+                              str(out_of_bounds[i]) + ")")
+            if failed[i] >= 0.5 * configs[i].get("sample_size", members):
+                self.printer.warning("At least half of the values of D" + str(i) + " are expected to fail, check its "
+                                     "bounds and tries.")
+        self.printer.info("option files:\t\t\t" + str(option_files) + " (" + str(int(round(option_file_bytes))) +
+                          " bytes)")
+        if bundle == "shared":
+            self.printer.info("varying options:\t\t" + str(int(round(varying_bytes))) + " bytes on the command lines")
+        self.printer.info("files (inodes) generated:\t" + str(files))
+        self.printer.info("output files of the runs:\t" + str(output_files))
+        self.printer.seperator()
+        self.printer.info("processes per member:\t\t" + str(processes))
+        self.printer.info("spin-up years per member:\t" + str(spinup_years))
+        if core_hours is None:
+            self.printer.warning("No seconds per spin-up year given (--seconds_per_spinup_year or "
+                                 "\"seconds_per_spinup_year\" in the config), core-hours not estimated.")
+        else:
+            self.printer.info("seconds per spin-up year:\t" + str(seconds_per_spinup_year))
+            self.printer.info("core-hours:\t\t\t" + str(core_hours))
+            if "scheduler" in yaml_data:
+                scheduler = yaml_data["scheduler"]
+                slots = max(1, scheduler.get("nodes", 1) * scheduler["cores_per_node"] // processes)
+                members_per_task = scheduler.get("members_per_task", slots)
+                waves = int(np.ceil(min(members_per_task, members) / slots))
+                self.printer.info("array tasks:\t\t\t" + str(int(np.ceil(members / members_per_task))) +
+                                  " (wall time per task " + format_duration(waves * spinup_years *
+                                                                            seconds_per_spinup_year) +
+                                  ", configured " + str(scheduler.get("walltime", "24:00:00")) + ")")
+        self.printer.double_seperator()
+
+        return {"members": members, "failed": failed, "option_files": option_files,
+                "option_file_bytes": option_file_bytes, "files": files, "output_files": output_files,
+                "core_hours": core_hours}
+
+    # Checks that the design is sequential and returns the index of the first member of the "batch". A sequential design
+    # is a joint design generated in batches of "batch_size" members (the "sequential" section of the config), so
+    # members can be added until the estimates of the outputs are precise enough (see di.py --convergence). Every batch
+    # is drawn from random streams of its own, so the batches do not depend on each other and batch 0 equals a joint
+    # design of "batch_size" members.
+    #
+    # batch:   the index of the batch
+    # returns: the index of the first member of the batch
+    def first_member_of_batch(self, batch):
+        yaml_data = self.config.yaml_data
+        if yaml_data["distributions"].get("mode", "product") != "joint" or "sequential" not in yaml_data:
+            raise ToolkitError("Batches can only be generated for a joint design with a \"sequential\" section.")
+        sequential = yaml_data["sequential"]
+        max_batches = sequential.get("max_batches")
+        if batch < 0 or (max_batches is not None and batch >= max_batches):
+            raise ToolkitError("Batch " + str(batch) + " is out of range (max_batches: " + str(max_batches) + ").")
+        return batch * sequential["batch_size"]
+
+    # Writes one option file with the options shared by all members ("<file_name>_shared.txt") instead of one option
+    # file per member. The options varying between the members are passed on the command line after the shared option
+    # file, so a design of any size needs a single option file. Prints the number of files and bytes saved compared to
+    # one option file per member.
+    #
+    # content:                the lines of the template option file
+    # indicator_replacements: the dictionary option file indicator -> its replacement
+    # value_array:            the values of every distribution
+    # indices:                for every member the index of its value in every distribution, see generate_members()
+    # first_member:           the index of the first member
+    # returns:                for every member the shared option file name followed by its varying options
+    def write_shared_option_file(self, content, indicator_replacements, value_array, indices, first_member=0):
+        yaml_data = self.config.yaml_data
+        shared_name = yaml_data["file_name"] + "_shared.txt"
+        shared, varying = split_option_file(content, indicator_replacements)
+        write_txt_file(yaml_data["output_directory"] + shared_name, shared)
+
+        arguments = []
+        option_file_bytes = 0
+        for member in range(len(indices)):
+            lines = member_lines(varying, first_member + member, value_array, indices[member])
+            arguments.append(" ".join([shared_name] + [shlex.quote(word) for line in lines for word in line.split()]))
+            # the option file of the member would hold the shared lines and its varying lines
+            option_file_bytes += len(shared) + len("".join(lines))
+        self.printer.info("Wrote the shared option file " + yaml_data["output_directory"] + shared_name + " (" +
+                          str(len(shared)) + " bytes) and " + str(len(varying)) + " varying options per member "
+                          "instead of " + str(len(indices)) + " option files (" + str(option_file_bytes) + " bytes)")
+        return arguments
+
+    # Generates random values from the distributions configured by the config. The function then prints out attributes
+    # of the distributions of the generated values (i.a. expected values, variances and the deltas / differences
+    # between generated and entered parameters)
+    #
+    # distribution_index: the index of the distribution to generate the values for
+    # seed:               the seed of the design, see get_seed()
+    # returns:            the array with the generated values
+    def generate_random_parameter(self, distribution_index, seed):
+        self.printer.info("Generating random parameter values for distribution D" + str(distribution_index) + "...")
+
+        distributions_config = self.config.yaml_data["distributions"]
+        distribution_config = distributions_config["D" + str(distribution_index)]
+        sample_size = distribution_config["sample_size"]
+
+        try:
+            distribution = dists.from_config(distribution_config)
+        except KeyError as exception:
+            raise ToolkitError(str(exception.args[0]))
+
+        chunk_size = distributions_config.get("chunk_size", default_chunk_size)
+        chunks = range(int(np.ceil(sample_size / chunk_size)))
+        arguments = [(distribution_config, seed, distribution_index, chunk, chunk_size) for chunk in chunks]
+        results = self.map_chunks(generate_chunk, arguments)
+
+        values = np.concatenate([result[0] for result in results])
+        failed = np.concatenate([result[1] for result in results])
+        self.print_generation_result(distribution_index, distribution, values, failed, distribution_config["tries"],
+                                     distribution_config["value_on_fail"])
+
+        return values.tolist()
+
+    # Prints out the result of the generation of the values of a distribution, raises a ToolkitError if all values
+    # failed.
+    #
+    # distribution_index: the index of the distribution
+    # distribution:       the configured distribution
+    # values:             the generated values
+    # failed:             a boolean array marking the failed values
+    # tries:              the number of tries per value
+    # value_on_fail:      the value failed values were set to
+    def print_generation_result(self, distribution_index, distribution, values, failed, tries, value_on_fail):
+        parameter_array = values.tolist()
+        number_of_failed_generations = np.count_nonzero(failed)
+
+        for i in np.flatnonzero(failed):
+            self.printer.debug("Failed to generate value for parameter " + str(i))
+        if number_of_failed_generations == len(parameter_array):
+            raise ToolkitError("Failed to generate all parameter values of distribution D" + str(distribution_index) +
+                               ".")
+
+        if self.config.print_array:
+            self.printer.info("Generated values for distribution D" + str(distribution_index) + ": " +
+                              str(parameter_array))
+
+        if not (number_of_failed_generations == 0):
+            self.printer.warning("Values for distribution D" + str(distribution_index) + " generated. Failed to "
+                                 "generate " + str(number_of_failed_generations) + " parameters after " + str(tries) +
+                                 " tries. They will be set to " + str(value_on_fail) + ".")
+        else:
+            self.printer.success("Random parameter values for distribution D" + str(distribution_index) +
+                                 " successfully generated.")
+        self.print_distribution_values(distribution_index, distribution, values[~failed])
+
+    # Prints out the parameters, expected value and variance of the configured "distribution" next to the ones
+    # estimated from the generated "values" and their deltas. The parameters of an empirical distribution (its values)
+    # are not estimated, so it has no parameter deltas.
+    #
+    # distribution_index: the index of the distribution
+    # distribution:       the configured distribution
+    # values:             the generated values
+    def print_distribution_values(self, distribution_index, distribution, values):
+        estimated = distribution.refit(values)
+        parameters = distribution.parameters()
+        estimated_parameters = estimated.parameters()
+
+        self.printer.double_seperator()
+        self.printer.info("Anticipated values for distribution D" + str(distribution_index) + " (" +
+                          distribution.name + "): ")
+        self.printer.double_seperator()
+        for key in parameters:
+            self.printer.info("used " + key + ":\t\t" + str(parameters[key]))
+        self.printer.info("expected value:\t\t" + str(distribution.mean()))
+        self.printer.info("expected variance:\t" + str(distribution.variance()))
+        self.printer.seperator()
+        for key in estimated_parameters:
+            self.printer.info("estimated " + key + ":\t\t" + str(estimated_parameters[key]))
+        self.printer.info("estimated expected value:" + str(estimated.mean()))
+        self.printer.info("estimated variance:\t" + str(estimated.variance()))
+        self.printer.seperator()
+        for key in parameters:
+            if key in estimated_parameters and not isinstance(distribution, dists.Empirical):
+                self.printer.info(key + " delta:\t\t" + str(np.absolute(parameters[key] - estimated_parameters[key])))
+        self.printer.info("expected value delta:\t" + str(np.absolute(distribution.mean() - estimated.mean())))
+        self.printer.info("variance delta:\t\t" + str(np.absolute(distribution.variance() - estimated.variance())))
+        self.printer.double_seperator()
+
+    # Generates the values of all distributions jointly: the i-th values of all distributions form the parameter vector
+    # of the i-th member. The vectors are drawn from a gaussian copula with the configured "correlation" matrix
+    # (default: no correlation) over the configured distributions as marginals, so exactly "sample_size" members are
+    # generated ("batch_size" members of a batch of a sequential design).
+    #
+    # seed:    the seed of the design, see get_seed()
+    # batch:   the index of the batch of a sequential design, see first_member_of_batch() (None generates all members)
+    # returns: the array with the generated values of every distribution
+    def generate_joint_parameters(self, seed, batch=None):
+        self.printer.info("Generating joint random parameter values...")
+
+        distributions_config = self.config.yaml_data["distributions"]
+        number_of_distributions = distributions_config["number"]
+        sample_size = distributions_config["sample_size"]
+        if batch is not None:
+            sample_size = self.config.yaml_data["sequential"]["batch_size"]
+        configs = [distributions_config["D" + str(i)] for i in range(number_of_distributions)]
+        correlation, cholesky = correlation_cholesky(distributions_config)
+        try:
+            marginals = [dists.from_config(config) for config in configs]
+        except KeyError as exception:
+            raise ToolkitError(str(exception.args[0]))
+
+        chunk_size = distributions_config.get("chunk_size", default_chunk_size)
+        chunks = range(int(np.ceil(sample_size / chunk_size)))
+        first_chunk = 0
+        if batch is not None:
+            first_chunk = batch * len(chunks)
+        results = self.map_chunks(generate_joint_chunk, [(configs, cholesky, sample_size, seed, chunk, chunk_size,
+                                                          first_chunk) for chunk in chunks])
+        values = np.concatenate([result[0] for result in results])
+        failed = np.concatenate([result[1] for result in results])
+
+        for i in range(number_of_distributions):
+            self.print_generation_result(i, marginals[i], values[:, i], failed[:, i],
+                                         max(config["tries"] for config in configs), configs[i]["value_on_fail"])
+
+        self.printer.info("Used correlation matrix:\n" + str(correlation))
+        self.printer.info("Spearman correlation matrix of the generated values:\n" +
+                          str(stats.correlation_matrix(values, "spearman")))
+        self.printer.double_seperator()
+
+        return [dists.typed_values(marginals[i], values[:, i]).tolist() for i in range(number_of_distributions)]
+
+    # Generates a Morris screening design over the configured distributions: "trajectories" trajectories of k + 1
+    # members (k being the number of distributions) on a grid of "levels" levels, selected from "candidates" random
+    # trajectories for the best spread. The design is saved to "morris.csv" in the output directory for the analysis by
+    # di.py.
+    #
+    # seed:    the seed of the design, see get_seed()
+    # returns: the array with the generated values of every distribution
+    def generate_morris_parameters(self, seed):
+        self.printer.info("Generating Morris screening design...")
+
+        distributions_config = self.config.yaml_data["distributions"]
+        number_of_distributions = distributions_config["number"]
+        configs = [distributions_config["D" + str(i)] for i in range(number_of_distributions)]
+        r = distributions_config["trajectories"]
+        levels = distributions_config.get("levels", 4)
+        candidates = distributions_config.get("candidates", 10 * r)
+        if not isinstance(levels, int) or levels < 2 or levels % 2 != 0:
+            raise ToolkitError("The number of levels of a Morris design has to be even, got " + str(levels) + ".")
+        try:
+            marginals = [dists.from_config(config) for config in configs]
+        except KeyError as exception:
+            raise ToolkitError(str(exception.args[0]))
+
+        generator = chunk_generator(seed, morris_stream, 0)
+        trajectories = morris.select_trajectories(
+            morris.generate_trajectories(max(candidates, r), number_of_distributions, levels, generator), r)
+        unit = trajectories.reshape(-1, number_of_distributions)
+        values = morris.scale(unit, levels, marginals, [config["lower_bound"] for config in configs],
+                              [config["upper_bound"] for config in configs])
+
+        design_path = self.config.yaml_data["output_directory"] + "morris.csv"
+        morris.write_design(design_path, unit, values)
+        self.printer.info("Generated " + str(r) + " trajectories (" + str(len(unit)) + " members) with " +
+                          str(levels) + " levels from " + str(max(candidates, r)) + " candidates: " + design_path)
+        if self.config.print_array:
+            for i in range(number_of_distributions):
+                self.printer.info("Generated values for distribution D" + str(i) + ": " + str(values[:, i].tolist()))
+        self.printer.double_seperator()
+
+        return [dists.typed_values(marginals[i], values[:, i]).tolist() for i in range(number_of_distributions)]
+
+    # Calls "function" with every tuple of "arguments", using a pool of "workers" processes if there is more than one.
+    #
+    # function:  the function to call, e.g. generate_chunk()
+    # arguments: a list of argument tuples
+    # returns:   the list of results in the order of the arguments
+    def map_chunks(self, function, arguments):
+        if self.config.workers > 1 and len(arguments) > 1:
+            with ProcessPoolExecutor(max_workers=self.config.workers) as executor:
+                return list(executor.map(function, *zip(*arguments)))
+        return [function(*argument) for argument in arguments]
+
+    # Returns the seed configured by "seed" in the config. Without a configured seed a new one is drawn from the
+    # operating system and printed, so the design can be reproduced by adding it to the config. A batch of a sequential
+    # design uses the seed of the earlier batches (see seed_file_name) instead of drawing a new one. The seed is kept
+    # as "seed" of the generator and written to the output directory by generate().
+    #
+    # batch:   the index of the batch of a sequential design (None for a whole design)
+    # returns: the seed
+    def get_seed(self, batch=None):
+        seed = self.config.yaml_data.get("seed")
+        seed_path = self.config.yaml_data["output_directory"] + seed_file_name
+        if seed is None and batch is not None and os.path.isfile(seed_path):
+            with open(seed_path) as file_stream:
+                seed = int(file_stream.read())
+            self.printer.info("No seed configured, using the seed of the earlier batches: " + str(seed))
+        elif seed is None:
+            seed = np.random.SeedSequence().entropy
+            self.printer.info("No seed configured, using seed: " + str(seed))
+        self.seed = seed
+        return seed
+
+
+# Lists the members of the design, i.e. the option files to generate. In "product" mode every combination of the values
+# of all distributions is a member, the first distribution changing fastest. In "joint" and "morris" mode the i-th
+# member uses the i-th value of every distribution. The position of a member in the list (plus "first_member") is its
+# index, which replaces %i% in the tracer output file.
+#
+# mode:         the sampling mode ("product", "joint" or "morris")
+# file_name:    the prefix of the option file names
+# value_array:  the values of every distribution
+# first_member: the index of the first member, e.g. of a batch of a sequential design
+# returns:      the option file names and for every member the index of its value in every distribution
+def generate_members(mode, file_name, value_array, first_member=0):
+    if mode != "product":
+        indices = [[member] * len(value_array) for member in range(len(value_array[0]))]
+        names = [file_name + str(first_member + member) + ".txt" for member in range(len(indices))]
+        return names, indices
+
+    ranges = [range(len(values)) for values in reversed(value_array)]
+    indices = [list(reversed(index)) for index in itertools.product(*ranges)]
+    # option{i}-{j}-{k}.txt, padded to at least three indices
+    names = [file_name + "-".join(str(i) for i in index + [0] * (3 - len(index))) + ".txt" for index in indices]
+    return names, indices
+
+
+# Returns the number of members of a design: the product of the sample sizes of all distributions in "product" mode, the
+# "sample_size" (or the "batch_size" of a batch of a sequential design) in "joint" mode and "trajectories" times the
+# number of distributions plus one in "morris" mode.
+#
+# yaml_data: the yaml data
+# batch:     the index of the batch of a sequential design (None counts the whole design)
+# returns:   the number of members
+def number_of_members(yaml_data, batch=None):
+    distributions_config = yaml_data["distributions"]
+    number_of_distributions = distributions_config["number"]
+    mode = distributions_config.get("mode", "product")
+    if mode == "product":
+        members = 1
+        for i in range(number_of_distributions):
+            members *= int(distributions_config["D" + str(i)]["sample_size"])
+        return members
+    if mode == "joint":
+        if batch is not None:
+            return int(yaml_data["sequential"]["batch_size"])
+        return int(distributions_config["sample_size"])
+    if mode == "morris":
+        return int(distributions_config["trajectories"]) * (number_of_distributions + 1)
+    raise ToolkitError("Sampling mode not found: " + str(mode))
+
+
+# Checks the "correlation" matrix of a joint design (default: no correlation) and returns its cholesky factor.
+#
+# distributions_config: the "distributions" section of the config
+# returns:              the correlation matrix and its lower triangular cholesky factor
+def correlation_cholesky(distributions_config):
+    number_of_distributions = distributions_config["number"]
+    correlation = np.asarray(distributions_config.get("correlation", np.identity(number_of_distributions)),
+                             dtype=float)
+
+    if correlation.shape != (number_of_distributions, number_of_distributions) or \
+            not np.allclose(correlation, correlation.T) or not np.allclose(np.diag(correlation), 1):
+        raise ToolkitError("The correlation matrix has to be a symmetric " + str(number_of_distributions) + "x" +
+                           str(number_of_distributions) + " matrix with ones on its diagonal.")
+    try:
+        return correlation, np.linalg.cholesky(correlation)
+    except np.linalg.LinAlgError:
+        raise ToolkitError("The correlation matrix is not positive definite.")
+
+
+# Returns the total number of digits of the member indices "first" to "first" + "n" - 1, i.e. the bytes the %i% of
+# these members are replaced by.
+#
+# first:   the first member index
+# n:       the number of members
+# returns: the number of digits
+def index_digits(first, n):
+    total = 0
+    end = first + n
+    digits = len(str(first))
+    while first < end:
+        last = min(end, 10 ** digits)
+        total += (last - first) * digits
+        first = last
+        digits += 1
+    return total
+
+
+# Estimates the mean number of characters of a value of the "distribution" written to an option file, using the values
+# at evenly spaced quantiles inside of the bounds.
+#
+# distribution: the distribution
+# lower_bound:  the smallest accepted value
+# upper_bound:  the largest accepted value
+# returns:      the mean number of characters
+def value_length(distribution, lower_bound, upper_bound):
+    values = np.clip(distribution.ppf(np.linspace(0.025, 0.975, 39)), lower_bound, upper_bound)
+    return np.mean([len(str(float(value))) for value in values])
+
+
+# Formats a number of seconds as hours:minutes:seconds.
+#
+# seconds: the number of seconds
+# returns: the formatted time
+def format_duration(seconds):
+    seconds = int(np.ceil(seconds))
+    return str(seconds // 3600) + ":" + str(seconds // 60 % 60).zfill(2) + ":" + str(seconds % 60).zfill(2)
+
+
+# Generates the parameter vectors of the "chunk_index"-th chunk of a joint design, see generate_joint_parameters().
+# Vectors are redrawn up to the largest "tries" of the distributions.
+#
+# configs:     the configs of all distributions
+# cholesky:    the cholesky factor of the correlation matrix
+# sample_size: the number of members of the design (or of the batch)
+# seed:        the seed of the design
+# chunk_index: the index of the chunk
+# chunk_size:  the number of vectors per chunk
+# first_chunk: the index of the random stream of the first chunk (of the batch)
+# returns:     the vectors and a boolean matrix marking the failed values
+def generate_joint_chunk(configs, cholesky, sample_size, seed, chunk_index, chunk_size, first_chunk=0):
+    n = min(chunk_size, sample_size - chunk_index * chunk_size)
+    return dists.sample_bounded_copula([dists.from_config(config) for config in configs], cholesky, n,
+                                       [config["lower_bound"] for config in configs],
+                                       [config["upper_bound"] for config in configs],
+                                       max(config["tries"] for config in configs),
+                                       [config["value_on_fail"] for config in configs],
+                                       chunk_generator(seed, joint_stream, first_chunk + chunk_index))
+
+
+# Creates the random generator of the "chunk_index"-th chunk of the distribution "distribution_index". Every chunk has
+# its own independent stream derived from the seed (like SeedSequence.spawn), so chunks can be generated in parallel or
+# regenerated on their own and always yield the same values.
+#
+# seed:               the seed of the design
+# distribution_index: the index of the distribution (or joint_stream for a joint design)
+# chunk_index:        the index of the chunk
+# returns:            the random generator
+def chunk_generator(seed, distribution_index, chunk_index):
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed,
+                                                                      spawn_key=(distribution_index, chunk_index))))
+
+
+# Generates the values of the "chunk_index"-th chunk of a distribution.
+#
+# distribution_config: the config of the distribution (e.g. the "D0" entry of the config)
+# seed:                the seed of the design
+# distribution_index:  the index of the distribution
+# chunk_index:         the index of the chunk
+# chunk_size:          the number of values per chunk
+# returns:             the values and a boolean array marking the failed values, see distributions.sample_bounded()
+def generate_chunk(distribution_config, seed, distribution_index, chunk_index, chunk_size):
+    n = min(chunk_size, distribution_config["sample_size"] - chunk_index * chunk_size)
+    return dists.sample_bounded(dists.from_config(distribution_config), n, distribution_config["lower_bound"],
+                                distribution_config["upper_bound"], distribution_config["tries"],
+                                distribution_config["value_on_fail"],
+                                chunk_generator(seed, distribution_index, chunk_index))
 
 
 # Prints out the license
@@ -469,30 +1209,37 @@ if __name__ == '__main__':
                                                                    'histogram should be wide')
     parser.add_argument('-hs', '--histogram_spacing', type=int, help='set the number of spaces between the bars of '
                                                                      'the histogram')
+    parser.add_argument('-w', '--workers', type=int, help='set the number of processes used to generate the random '
+                                                          'values, the values do not depend on it')
+    parser.add_argument('-b', '--batch', type=int, help='generate only the given batch of a sequential design (see '
+                                                        'the "sequential" section of the config)')
+    parser.add_argument('--dry-run', action='store_true', help='estimate the number of members, failed generations, '
+                                                               'option file bytes, files and core-hours of the design '
+                                                               'without writing any files')
+    parser.add_argument('-sy', '--seconds_per_spinup_year', type=float, help='the wall-clock seconds one spin-up year '
+                                                                             'of a member takes, used by --dry-run')
     parser.add_argument('-sl', '--show_l', action='store_true', help='show the General Public License')
 
     args = parser.parse_args()
-    config_dir = args.config
-    debug = args.debug
-    quiet = args.quiet
-    print_array = args.print_array
-    display_histogram = args.display_histogram
-
-    if args.histogram_height is not None:
-        histogram_height = args.histogram_height
-    if args.histogram_buckets is not None:
-        histogram_buckets = args.histogram_buckets
-    if args.histogram_width is not None:
-        histogram_width = args.histogram_width
-    if args.histogram_spacing is not None:
-        histogram_spacing = args.histogram_spacing
-
-    show_l = False
-    show_l = args.show_l
-    if show_l:
+    default_printer = Printer(args.quiet, args.debug)
+
+    arguments = {"print_array": args.print_array, "display_histogram": args.display_histogram}
+    for argument in ["histogram_height", "histogram_buckets", "histogram_width", "histogram_spacing", "workers"]:
+        if getattr(args, argument) is not None:
+            arguments[argument] = getattr(args, argument)
+
+    if args.show_l:
         print_license()
 
     print_double_seperator()
     print(notice)
     print_double_seperator()
-    generate_option_files()
+    try:
+        generator = OptionFileGenerator(GeneratorConfig.from_file(args.config, **arguments), default_printer)
+        if args.dry_run:
+            generator.estimate_cost(args.batch, args.seconds_per_spinup_year)
+        else:
+            generator.generate(args.batch)
+    except ToolkitError as exception:
+        print_error(str(exception))
+        sys.exit(1)
@@ -0,0 +1,243 @@
+"""
+    Uncertainty-Analysis-Toolkit-for-Metos3d can be used to generate option files for Metos3d
+    and interpret Metos3d output data.
+    Copyright (C) 2022  Tom L. Hauschild
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+import os
+import queue
+import subprocess
+import threading
+import time
+import yaml
+import mpg
+
+# columns of the status file
+status_columns = ["index", "state", "exit_code", "attempts", "duration", "command"]
+
+# default values of the "runner" section of the config file
+default_cores = os.cpu_count()
+default_retries = 0
+default_status_file = "status.csv"
+default_log_directory = "logs/"
+
+
+# Reads the commands generated by mpg.py, one command per line.
+#
+# path:    the path of the mpirun.txt
+# returns: the list of commands
+def read_commands(path):
+    with open(path) as file_stream:
+        return [line.strip() for line in file_stream if line.strip()]
+
+
+# Replaces the program and the launcher of a command, e.g. to run a stub executable instead of metos3d-simpack-N.exe.
+#
+# command:      the command generated by mpg.py ("mpirun <options> <program> <option file>")
+# program_path: the program path used by mpg.py
+# options:      the mpirun options used by mpg.py
+# program:      the program to run instead (None keeps it)
+# launcher:     the launcher replacing "mpirun <options>" (None keeps it, "" runs the program directly)
+# returns:      the command
+def substitute(command, program_path, options, program, launcher):
+    if program is not None:
+        command = command.replace(program_path, program, 1)
+    if launcher is not None:
+        command = command.replace(("mpirun " + options).strip(), launcher, 1).strip()
+    return command
+
+
+# returns: the number of cores a command uses (its "-np" / "-n" value, 1 if not given)
+def cores_of(command):
+    return mpg.get_number_of_processes(command)
+
+
+# Reads the status file of an earlier run.
+#
+# path:    the path of the status file
+# returns: a dictionary command index -> row of the status file (empty if there is no status file)
+def read_status(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file_stream:
+        return {int(row["index"]): row for row in csv.DictReader(file_stream)}
+
+
+# Writes the status of all commands to the status file. The file is replaced at once, so it is never read half written.
+#
+# path: the path of the status file
+# rows: the status of every command, see status_columns
+def write_status(path, rows):
+    with open(path + ".tmp", "w") as file_stream:
+        writer = csv.DictWriter(file_stream, fieldnames=status_columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(path + ".tmp", path)
+
+
+# Waits for the "process" of the command "index" to exit and puts the index, the exit code and the time of the exit
+# into the "finished" queue, so the runner learns about every exit as soon as it happens.
+#
+# process:  the subprocess.Popen of the command
+# index:    the index of the command
+# finished: the queue.Queue of the finished commands
+def wait_for(process, index, finished):
+    exit_code = process.wait()
+    finished.put((index, exit_code, time.monotonic()))
+
+
+# Runs the "commands" with at most "cores" cores in use at a time: a command is started as soon as enough cores are
+# free for its "-np" value, commands are started in their order but a smaller command may start before a larger one
+# that does not fit yet. Failed commands are run again up to "retries" times. Every process is waited for by a thread
+# of its own, so the next command starts as soon as one exits and the durations are measured up to the exit. Exit
+# codes, durations and attempts are written to the status file after every change, commands marked as done in an
+# existing status file are skipped.
+#
+# commands:      the commands to run
+# needed_cores:  the number of cores of every command, see cores_of()
+# cores:         the number of cores available
+# retries:       the number of times a failed command is run again
+# status_path:   the path of the status file
+# log_directory: the directory of the output of every command (run<index>.log)
+# printer:       the mpg.Printer of the messages (default: the printer of the command line interface)
+# returns:       the status of every command, see status_columns
+def run_commands(commands, needed_cores, cores, retries, status_path, log_directory, printer=None):
+    if printer is None:
+        printer = mpg.default_printer
+    previous = read_status(status_path)
+    rows = []
+    for index in range(len(commands)):
+        row = {"index": index, "state": "pending", "exit_code": "", "attempts": 0, "duration": "",
+               "command": commands[index]}
+        if index in previous and previous[index]["state"] == "done" and previous[index]["command"] == commands[index]:
+            row = previous[index]
+        rows.append(row)
+
+    os.makedirs(log_directory, exist_ok=True)
+    pending = [index for index in range(len(commands)) if rows[index]["state"] != "done"]
+    printer.info("Running " + str(len(pending)) + " of " + str(len(commands)) + " commands on " + str(cores) +
+                 " cores.")
+    for index in pending:
+        if needed_cores[index] > cores:
+            printer.warning("Command " + str(index) + " needs " + str(needed_cores[index]) + " cores, it will run "
+                            "alone.")
+
+    running = {}
+    finished = queue.Queue()
+    # the status file is only written when a command started or finished
+    changed = True
+    try:
+        while pending or running:
+            used = sum(job[2] for job in running.values())
+            for index in list(pending):
+                needed = needed_cores[index]
+                if used + needed <= cores or not running:
+                    log = open(os.path.join(log_directory, "run" + str(index) + ".log"), "a")
+                    process = subprocess.Popen(commands[index], shell=True, stdout=log, stderr=subprocess.STDOUT)
+                    running[index] = (process, time.monotonic(), needed, log)
+                    threading.Thread(target=wait_for, args=(process, index, finished), daemon=True).start()
+                    rows[index]["state"] = "running"
+                    rows[index]["attempts"] = int(rows[index]["attempts"]) + 1
+                    pending.remove(index)
+                    used += needed
+                    changed = True
+                    printer.debug("Started command " + str(index) + ": " + commands[index])
+            if changed:
+                write_status(status_path, rows)
+                changed = False
+
+            index, exit_code, end = finished.get()
+            process, start, needed, log = running.pop(index)
+            log.close()
+            changed = True
+            rows[index]["exit_code"] = exit_code
+            rows[index]["duration"] = round(end - start, 3)
+            if exit_code == 0:
+                rows[index]["state"] = "done"
+                printer.debug("Command " + str(index) + " done.")
+            elif int(rows[index]["attempts"]) <= retries:
+                rows[index]["state"] = "pending"
+                pending.insert(0, index)
+                printer.warning("Command " + str(index) + " failed with exit code " + str(exit_code) + ", retrying.")
+            else:
+                rows[index]["state"] = "failed"
+                printer.error("Command " + str(index) + " failed with exit code " + str(exit_code) + ".")
+        write_status(status_path, rows)
+    except KeyboardInterrupt:
+        for index in running:
+            running[index][0].terminate()
+            rows[index]["state"] = "pending"
+        write_status(status_path, rows)
+        raise
+
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='run the mpirun commands generated by mpg.py on the local node')
+    parser.add_argument('--config', metavar='path', required=True, help='set the path to the config.yaml used to '
+                                                                         'generate the commands')
+    parser.add_argument('-c', '--commands', metavar='path', help='the file of the commands (default mpirun.txt in '
+                                                                 'the output directory)')
+    parser.add_argument('-nc', '--cores', type=int, help='the number of cores that may be used at a time')
+    parser.add_argument('-r', '--retries', type=int, help='the number of times a failed command is run again')
+    parser.add_argument('-s', '--status', metavar='path', help='the path of the status file')
+    parser.add_argument('-ld', '--log_directory', metavar='path', help='the directory of the output of the commands')
+    parser.add_argument('-p', '--program', help='run this program instead of the configured program_path, e.g. a '
+                                                'stub executable for testing')
+    parser.add_argument('-l', '--launcher', help='replace "mpirun <options>" by this launcher ("" runs the program '
+                                                 'directly)')
+    parser.add_argument('-d', '--debug', action='store_true', help='enable debug mode for more information output')
+    parser.add_argument('-q', '--quiet', action='store_true', help='disable all outputs')
+
+    args = parser.parse_args()
+    mpg.default_printer = mpg.Printer(args.quiet, args.debug)
+
+    with open(args.config) as file_stream:
+        yaml_data = yaml.safe_load(file_stream)
+    runner_config = yaml_data.get("runner", {})
+
+    commands_path = args.commands
+    if commands_path is None:
+        commands_path = yaml_data["output_directory"] + "mpirun.txt"
+    cores = args.cores
+    if cores is None:
+        cores = runner_config.get("cores", default_cores)
+    retries = args.retries
+    if retries is None:
+        retries = runner_config.get("retries", default_retries)
+    status = args.status
+    if status is None:
+        status = runner_config.get("status_file", yaml_data["output_directory"] + default_status_file)
+    log_directory = args.log_directory
+    if log_directory is None:
+        log_directory = runner_config.get("log_directory", yaml_data["output_directory"] + default_log_directory)
+
+    generated = read_commands(commands_path)
+    commands = [substitute(command, yaml_data["mpirun"]["program_path"], yaml_data["mpirun"]["options"],
+                           args.program, args.launcher) for command in generated]
+    results = run_commands(commands, [cores_of(command) for command in generated], cores, retries, status,
+                           log_directory)
+
+    failed = [row for row in results if row["state"] != "done"]
+    if failed:
+        mpg.print_error(str(len(failed)) + " of " + str(len(results)) + " commands failed, see " + status)
+        exit(1)
+    mpg.print_success("All " + str(len(results)) + " commands done, see " + status)
@@ -18,22 +18,52 @@
 """
 
 import numpy as np
+from scipy.stats import rankdata, kstest, kstwo, kstwobign, norm, t
+import distributions as dists
+from sketch import QuantileSketch
 
 
 # Estimates important attributes of the "data" interpreted as being lognormal distributed.
 #
-# data:    the data (array of numbers) to be analyzed
+# data:    the data (array of numbers or a QuantileSketch) to be analyzed
 # returns: mu, sigma, estimated value, variance
 def estimate_lognorm_data_values(data):
-    # estimating mu
-    mu = np.sum(np.log(data)) / len(data)
-    # estimating sigma^2
-    s2 = np.sum((np.log(data) - mu) ** 2) / len(data)
-    # calculating expected value
-    e = np.exp(mu + 0.5 * s2)
-    # calculating variance
-    v = np.exp(2 * mu + s2) * (np.exp(s2) - 1)
-    return mu, np.sqrt(s2), e, v
+    if isinstance(data, QuantileSketch):
+        distribution = dists.Lognormal(*data.log_moments())
+    else:
+        distribution = dists.Lognormal.fit(data)
+    return distribution.mu, distribution.sigma, distribution.mean(), distribution.variance()
+
+
+# Estimates the expected value and the variance of the "data".
+#
+# data:    the data (array of numbers or a QuantileSketch) to be analyzed
+# returns: estimated value, variance
+def estimate_normal_data_values(data):
+    if isinstance(data, QuantileSketch):
+        return data.mean(), data.variance()
+    return np.mean(data), np.var(data)
+
+
+# Kolmogorov-Smirnov test of the "data" against the distribution function "cdf". For a QuantileSketch the statistic is
+# evaluated at the values kept in the sketch, it deviates from the exact statistic by at most the rank error of the
+# sketch (see QuantileSketch.rank_error()).
+#
+# data:    the data (array of numbers or a QuantileSketch) to be tested
+# cdf:     the distribution function of the tested distribution
+# returns: statistic, p-value
+def ks_test(data, cdf):
+    if not isinstance(data, QuantileSketch):
+        result = kstest(data, cdf)
+        return result[0], result[1]
+
+    items, ranks = data.weighted_items()
+    expected = cdf(items)
+    below = np.concatenate(([0.0], ranks[:-1])) / data.n
+    statistic = max(np.max(ranks / data.n - expected), np.max(expected - below))
+    if data.n > 10000:
+        return statistic, kstwobign.sf(statistic * np.sqrt(data.n))
+    return statistic, kstwo.sf(statistic, data.n)
 
 
 # Calculates the estimated value and the variance of a lognormal distribution with the given parameters mu and s.
@@ -42,17 +72,17 @@ def estimate_lognorm_data_values(data):
 # s:       the sigma
 # returns: the estimated value and the variance
 def lognorm_values(mu, s):
-    s2 = s ** 2
-    e = np.exp(mu + 0.5 * s2)
-    v = np.exp(2 * mu + s2) * (np.exp(s2) - 1)
-    return e, v
+    distribution = dists.Lognormal(mu, s)
+    return distribution.mean(), distribution.variance()
 
 
 # Calculates the largest number in the array "array".
 #
-# array:   the array to be analyzed
+# array:   the array (or QuantileSketch) to be analyzed
 # returns: the largest number in the array
 def get_largest_number(array):
+    if isinstance(array, QuantileSketch):
+        return array.max
     largest_number = array[0]
     for element in array:
         if element > largest_number:
@@ -62,9 +92,11 @@ def get_largest_number(array):
 
 # Calculates the smallest number in the array "array".
 #
-# array:   the array to be analyzed
+# array:   the array (or QuantileSketch) to be analyzed
 # returns: the smallest number in the array
 def get_smallest_number(array):
+    if isinstance(array, QuantileSketch):
+        return array.min
     smallest_number = array[0]
     for element in array:
         if element < smallest_number:
@@ -97,3 +129,101 @@ def empirical_correlation_coefficient(values1, values2):
     r11 = np.sum(np.multiply(values2, values2)) - ((1/n) * np.sum(values2) ** 2)
     r1 = np.sqrt(r10 * r11)
     return r0 / r1
+
+
+# Calculates the correlation matrix of all columns of "values" at once. Every column is one variable (e.g. a parameter
+# or a reduced output), every row is one ensemble member.
+#
+# values:  a matrix with one row per member and one column per variable
+# method:  "pearson" for the empirical correlation coefficient or "spearman" for the rank correlation coefficient
+# returns: a square matrix with the correlation coefficient of column i and column j at [i, j]
+def correlation_matrix(values, method="pearson"):
+    values = np.asarray(values, dtype=float)
+    if method == "spearman":
+        values = rankdata(values, axis=0)
+    elif method != "pearson":
+        raise ValueError("Unknown correlation method: " + str(method))
+
+    centered = values - np.mean(values, axis=0)
+    norms = np.sqrt(np.sum(centered ** 2, axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (centered.T @ centered) / np.outer(norms, norms)
+
+
+# Calculates the linear regression function y = b * x + a for every pair of columns of "values" at once.
+#
+# values:  a matrix with one row per member and one column per variable
+# returns: the slopes b and the intercepts a as square matrices, [i, j] being the regression of column j on column i
+def linear_regression_matrix(values):
+    values = np.asarray(values, dtype=float)
+    means = np.mean(values, axis=0)
+    centered = values - means
+    covariance = centered.T @ centered
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = covariance / np.diag(covariance)[:, np.newaxis]
+    intercepts = means[np.newaxis, :] - slopes * means[:, np.newaxis]
+    return slopes, intercepts
+
+
+# Confidence interval of the mean of the "data" (Student t interval).
+#
+# data:       the data
+# confidence: the confidence level, e.g. 0.95
+# returns:    the estimated mean and the lower and upper bound of its confidence interval
+def mean_confidence_interval(data, confidence):
+    data = np.asarray(data, dtype=float)
+    n = len(data)
+    mean = np.mean(data)
+    half_width = t.ppf((1 + confidence) / 2, n - 1) * np.std(data, ddof=1) / np.sqrt(n)
+    return mean, mean - half_width, mean + half_width
+
+
+# Confidence interval of the variance of the "data". The standard error of the sample variance is estimated from the
+# fourth central moment, so the interval does not assume normal data (a chi-square interval is far too narrow for
+# heavy-tailed data like lognormal outputs).
+#
+# data:       the data
+# confidence: the confidence level, e.g. 0.95
+# returns:    the estimated variance and the lower and upper bound of its confidence interval
+def variance_confidence_interval(data, confidence):
+    data = np.asarray(data, dtype=float)
+    n = len(data)
+    variance = np.var(data, ddof=1)
+    fourth_moment = np.mean((data - np.mean(data)) ** 4)
+    standard_error = np.sqrt(max(fourth_moment - variance ** 2 * (n - 3) / (n - 1), 0) / n)
+    half_width = norm.ppf((1 + confidence) / 2) * standard_error
+    return variance, variance - half_width, variance + half_width
+
+
+# Distribution-free confidence interval of the "q"-quantile of the "data": the interval between the order statistics
+# whose ranks bound the binomial number of values below the quantile. The bounds are infinite if the data is too small
+# for the confidence level.
+#
+# data:       the data
+# q:          the quantile (0 < q < 1)
+# confidence: the confidence level, e.g. 0.95
+# returns:    the estimated quantile and the lower and upper bound of its confidence interval
+def quantile_confidence_interval(data, q, confidence):
+    data = np.sort(np.asarray(data, dtype=float))
+    n = len(data)
+    half_width = norm.ppf((1 + confidence) / 2) * np.sqrt(n * q * (1 - q))
+    # ranks of the order statistics, starting at 1
+    lower = int(np.floor(n * q - half_width))
+    upper = int(np.ceil(n * q + half_width))
+    lower_bound = data[lower - 1] if lower >= 1 else -np.inf
+    upper_bound = data[upper - 1] if upper <= n else np.inf
+    return np.quantile(data, q), lower_bound, upper_bound
+
+
+# Returns the smallest number of values whose confidence interval of the "q"-quantile (see
+# quantile_confidence_interval()) has finite bounds, i.e. whose order statistic ranks both lie in 1..n.
+#
+# q:          the quantile (0 < q < 1)
+# confidence: the confidence level, e.g. 0.95
+# returns:    the number of values
+def quantile_minimum_size(q, confidence):
+    z = norm.ppf((1 + confidence) / 2)
+    n = 1
+    while np.floor(n * q - z * np.sqrt(n * q * (1 - q))) < 1 or np.ceil(n * q + z * np.sqrt(n * q * (1 - q))) > n:
+        n += 1
+    return n
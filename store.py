@@ -0,0 +1,147 @@
+"""
+    Uncertainty-Analysis-Toolkit-for-Metos3d can be used to generate option files for Metos3d
+    and interpret Metos3d output data.
+    Copyright (C) 2022  Tom L. Hauschild
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import sqlite3
+import numpy as np
+
+# the table of the members, one row per member and one column per parameter and reduction
+table = "members"
+# the text columns every store has besides the member index, all other columns are numbers
+text_columns = ["option_file", "output_file"]
+
+
+# Quotes a column name for SQL, so names like "N[0]" can be used.
+#
+# name:    the column name
+# returns: the quoted column name
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+# An SQLite file joining the parameters and the outputs of an ensemble by the member index (the index replacing %i% in
+# the tracer output file). mpg.py writes the option file, the output file and the parameter values (D0, D1, ...) of
+# every member, di.py adds its reductions of the outputs as further columns. Columns are loaded as whole numpy arrays,
+# optionally filtered by an SQL condition on any column.
+class EnsembleStore:
+
+    # path: the path of the SQLite file, it is created if it does not exist
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS " + table + " (member INTEGER PRIMARY KEY, option_file "
+                                "TEXT, output_file TEXT)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+    # Closes the SQLite file.
+    def close(self):
+        self.connection.close()
+
+    # returns: the names of all columns of the store
+    def columns(self):
+        return [row[1] for row in self.connection.execute("PRAGMA table_info(" + table + ")")]
+
+    # returns: the number of members in the store
+    def size(self):
+        return self.connection.execute("SELECT COUNT(*) FROM " + table).fetchone()[0]
+
+    # Adds the column "name" if the store does not have it yet.
+    #
+    # name: the name of the column
+    # kind: the SQL type of the column
+    def add_column(self, name, kind="REAL"):
+        if name not in self.columns():
+            self.connection.execute("ALTER TABLE " + table + " ADD COLUMN " + quote(name) + " " + kind)
+
+    # Writes the members of a design, replacing all members and columns of an earlier design. The members of a batch of
+    # a sequential design ("replace" False) are written next to the members of the other batches instead, replacing
+    # only the members of the same indices, so batches can be written again or in any order.
+    #
+    # option_files: the option file name of every member
+    # output_files: the tracer output file of every member
+    # value_array:  the values of every distribution
+    # indices:      for every member the index of its value in every distribution, see mpg.generate_members()
+    # first_member: the index of the first member
+    # replace:      if True the members and columns of an earlier design are removed
+    def write_members(self, option_files, output_files, value_array, indices, first_member=0, replace=True):
+        names = ["D" + str(i) for i in range(len(value_array))]
+        with self.connection:
+            if replace:
+                self.connection.execute("DROP TABLE " + table)
+                self.connection.execute("CREATE TABLE " + table + " (member INTEGER PRIMARY KEY, option_file TEXT, "
+                                        "output_file TEXT" + "".join(", " + quote(name) + " REAL" for name in names) +
+                                        ")")
+            else:
+                for name in names:
+                    self.add_column(name)
+            rows = ([first_member + member, option_files[member], output_files[member]] +
+                    [value_array[i][indices[member][i]] for i in range(len(value_array))]
+                    for member in range(len(option_files)))
+            self.connection.executemany("INSERT OR REPLACE INTO " + table + " (member, option_file, output_file" +
+                                        "".join(", " + quote(name) for name in names) + ") VALUES (" +
+                                        ", ".join(["?"] * (len(names) + 3)) + ")", rows)
+
+    # Writes the "values" of the column "name" (added if needed), e.g. a reduction of the outputs computed by di.py.
+    # Members not in the store yet are added.
+    #
+    # name:    the name of the column
+    # values:  the values of the members
+    # members: the member index of every value (default: 0, 1, 2, ...)
+    def write_column(self, name, values, members=None):
+        if members is None:
+            members = range(len(values))
+        self.add_column(name)
+        with self.connection:
+            self.connection.executemany("INSERT INTO " + table + " (member, " + quote(name) + ") VALUES (?, ?) ON "
+                                        "CONFLICT(member) DO UPDATE SET " + quote(name) + " = excluded." + quote(name),
+                                        zip((int(member) for member in members), (float(value) for value in values)))
+
+    # Creates an index on the column "name", which speeds up conditions on that column.
+    #
+    # name: the name of the column
+    def create_index(self, name):
+        with self.connection:
+            self.connection.execute("CREATE INDEX IF NOT EXISTS " + quote("index_" + name) + " ON " + table + " (" +
+                                    quote(name) + ")")
+
+    # Loads whole columns of the members matching the "condition", ordered by the member index, so the values of
+    # different columns at the same position belong to the same member.
+    #
+    # names:      the names of the columns
+    # condition:  an SQL condition on the columns, e.g. '"D0" > 0.02 AND "N[0]" IS NOT NULL' (None loads all members)
+    # parameters: the values of the "?" placeholders in the condition
+    # returns:    a dictionary column name -> numpy array of its values (missing values are NaN)
+    def load(self, names, condition=None, parameters=()):
+        query = "SELECT member" + "".join(", " + quote(name) for name in names) + " FROM " + table
+        if condition is not None:
+            query += " WHERE " + condition
+        rows = self.connection.execute(query + " ORDER BY member", parameters).fetchall()
+
+        loaded = {"member": np.array([row[0] for row in rows], dtype=int)}
+        for i in range(len(names)):
+            column = [row[i + 1] for row in rows]
+            if names[i] in text_columns:
+                loaded[names[i]] = np.array(column, dtype=object)
+            else:
+                loaded[names[i]] = np.array([np.nan if value is None else value for value in column], dtype=float)
+        return loaded
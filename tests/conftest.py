@@ -0,0 +1,15 @@
+import os
+import sys
+import types
+
+# the modules of the toolkit are flat files in the repository root, "statistics" has to shadow the standard library
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+if "statistics" in sys.modules and not getattr(sys.modules["statistics"], "__file__", "").startswith(root):
+    del sys.modules["statistics"]
+
+# di.py reads .petsc files with petsc_mod, which is not needed by the tested functions
+try:
+    import petsc_mod
+except ImportError:
+    sys.modules["petsc_mod"] = types.ModuleType("petsc_mod")
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+import statistics as stats
+
+
+def test_quantile_interval_is_infinite_for_small_n():
+    values = np.random.default_rng(0).lognormal(0, 1, 100)
+    estimate, lower, upper = stats.quantile_confidence_interval(values, 0.005, 0.95)
+    assert lower == -np.inf and np.isfinite(upper)
+
+
+@pytest.mark.parametrize("q", [0.001, 0.005, 0.05, 0.5, 0.95, 0.995])
+def test_quantile_minimum_size_gives_finite_bounds(q):
+    n = stats.quantile_minimum_size(q, 0.95)
+    values = np.random.default_rng(1).lognormal(0, 1, n)
+    assert np.all(np.isfinite(stats.quantile_confidence_interval(values, q, 0.95)))
+    smaller = np.random.default_rng(1).lognormal(0, 1, n - 1)
+    assert not np.all(np.isfinite(stats.quantile_confidence_interval(smaller, q, 0.95))) or n == 1
+
+
+@pytest.mark.parametrize("q", [0.005, 0.05, 0.995])
+def test_check_convergence_with_extreme_quantiles(q):
+    import di
+    values = np.random.default_rng(2).lognormal(0, 1, 30)
+    converged, needed = di.Analyzer().check_convergence(values, {"quantiles": {q: 1.0}})
+    assert not converged
+    assert needed >= stats.quantile_minimum_size(q, 0.95) and needed > 30
@@ -0,0 +1,38 @@
+import os
+import mpg
+import runner
+
+# the stub of the model: it records its option file and fails for option1.txt
+stub = """echo "$1" >> "{calls}"
+sleep 0.1
+[ "$1" != option1.txt ] || exit 3
+"""
+
+
+def run(tmp_path, retries):
+    calls = tmp_path / "calls.txt"
+    (tmp_path / "stub.sh").write_text(stub.format(calls=calls))
+    commands = ["sh " + str(tmp_path / "stub.sh") + " option" + str(i) + ".txt" for i in range(3)]
+    rows = runner.run_commands(commands, [1, 1, 1], 2, retries, str(tmp_path / "status.csv"),
+                               str(tmp_path / "logs"), mpg.Printer(quiet=True))
+    return rows, calls.read_text().split()
+
+
+def test_failed_command_is_retried(tmp_path):
+    rows, calls = run(tmp_path, 1)
+    assert calls.count("option1.txt") == 2
+    assert [row["state"] for row in rows] == ["done", "failed", "done"]
+    assert rows[1]["exit_code"] == 3 and rows[1]["attempts"] == 2
+    status = runner.read_status(str(tmp_path / "status.csv"))
+    assert status[1]["state"] == "failed" and status[1]["exit_code"] == "3" and status[1]["attempts"] == "2"
+    assert all(0.1 <= float(status[index]["duration"]) < 0.4 for index in status)
+    assert os.path.exists(tmp_path / "logs" / "run1.log")
+
+
+def test_rerun_skips_done_commands(tmp_path):
+    run(tmp_path, 0)
+    (tmp_path / "calls.txt").unlink()
+    rows, calls = run(tmp_path, 0)
+    assert calls == ["option1.txt"]
+    assert [row["state"] for row in rows] == ["done", "failed", "done"]
+    assert int(rows[0]["attempts"]) == 1 and rows[1]["attempts"] == 1